@@ -29,8 +29,8 @@ from .locales import LocaleData, LocaleData_cs, LocaleData_de, \
 from .i18n import TranslatableTextFactory, TranslatedTextFactory, \
     Localizable, TranslatableText, SelfTranslatableText, \
     TranslatablePluralForms, LocalizableDateTime, LocalizableTime, \
-    Decimal, Monetary, Concatenation, Translator, NullTranslator, \
-    GettextTranslator, Localizer, \
+    Decimal, Monetary, Concatenation, Rope, Translator, NullTranslator, \
+    GettextTranslator, MappedTranslations, Localizer, \
     concat, format
 
 from .util import is_sequence_of, camel_case_to_lower, text_to_id, \
@@ -38,7 +38,7 @@ from .util import is_sequence_of, camel_case_to_lower, text_to_id, \
     language_name, country_name, week_day_name, month_name, \
     attribute_value, ParseError
 
-from .nodes import ContentNode, Variant, Metadata
+from .nodes import ContentNode, Variant, LazyVariant, Metadata
 
 from .resources import Resource, Image, Stylesheet, Script, Translations, \
     Media, Audio, Video, Flash, ResourceProvider
@@ -55,7 +55,7 @@ from .content import Content, Container, Strong, Emphasized, \
     DefinitionList, FieldSet, TableCell, TableHeading, TableRow, \
     Table, Section, TableOfContents, NodeIndex, RootIndex, NoneContent, \
     SetVariable, Substitution, Figure, MathML, InlineSVG, \
-    coerce, join, link, dl, ul, ol, fieldset, p, sec, strong, em, u, \
+    coerce, intern_text, join, link, dl, ul, ol, fieldset, p, sec, strong, em, u, \
     code, cite, container, br, hr, pre, abbr
 
 from .widgets import Widget, Button, FoldableTree, Notebook, PopupMenuCtrl, \
@@ -109,7 +109,7 @@ from .parse import ProcessingError, Parser, MacroParser, HTMLProcessor, \
     html2lcg, add_processing_info
 
 from .read import Reader, FileReader, StructuredTextReader, DocFileReader, \
-    DocDirReader, reader
+    DocDirReader, VariantReadError, reader
 
 from .transform import data2content, data2html, html2data, \
     HTML2XML, XML2HTML, XML2Content
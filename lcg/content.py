@@ -53,6 +53,24 @@ if sys.version_info[0] > 2:
     basestring = str
 
 
+_SLOT_NAMES = {}
+
+
+def _slot_names(cls):
+    # Return the names of all slots of 'cls' including the inherited ones.
+    try:
+        return _SLOT_NAMES[cls]
+    except KeyError:
+        names = []
+        for c in cls.__mro__:
+            slots = c.__dict__.get('__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            names.extend(name for name in slots if name not in ('__dict__', '__weakref__'))
+        result = _SLOT_NAMES[cls] = tuple(names)
+        return result
+
+
 class Content(object):
     """Generic base class for all types of content.
 
@@ -63,6 +81,9 @@ class Content(object):
     structure.
 
     """
+
+    __slots__ = ('_parent', '_container', '_position', '_lang', '_page_number', '_resources',
+                 '_section_index')
     _ALLOWED_CONTAINER = None
 
     def __init__(self, lang=None, resources=()):
@@ -80,11 +101,31 @@ class Content(object):
         assert resources is None or isinstance(resources, (tuple, list)), resources
         self._parent = None
         self._container = None
+        self._position = None
         self._lang = lang
         self._page_number = ''
         self._resources = tuple(resources)
+        self._section_index = None
         super(Content, self).__init__()
 
+    def __getstate__(self):
+        # Content classes define '__slots__' to reduce memory consumption of
+        # big content trees, so the state must be collected explicitly for
+        # all pickle protocols and for 'copy' to work.  Derived classes
+        # without '__slots__' (such as those defined by applications) also
+        # have '__dict__'.
+        state = dict(getattr(self, '__dict__', ()))
+        for name in _slot_names(self.__class__):
+            try:
+                state[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def set_container(self, container):
         """Set the parent 'Container' to 'container'.
 
@@ -101,6 +142,10 @@ class Content(object):
             assert isinstance(container, cls), \
                 "Not a '%s' instance: %s" % (cls.__name__, container,)
         self._container = container
+        # The position is set by the container constructor (see '_sibling_index()').
+        self._position = None
+        # The section index is maintained by the root of the content tree.
+        self._section_index = None
 
     def set_parent(self, node):
         """Set the parent 'lcg.ContentNode' to 'node'.
@@ -168,10 +213,64 @@ class Content(object):
 
         """
         path = [self]
-        while path[0]._container is not None:
-            path.insert(0, path[0]._container)
+        while path[-1]._container is not None:
+            path.append(path[-1]._container)
+        path.reverse()
         return tuple(path)
 
+    def _root_section_index(self):
+        # Return the section index of the content tree containing this element.
+        # The index is built by the root element of the tree in one pass and is
+        # a pair of dictionaries (SECTIONS, POSITIONS).  SECTIONS maps the tree
+        # root and each section to the list of its subsections as returned by
+        # 'sections()'.  POSITIONS maps each section to the pair (NUMBER, DEPTH),
+        # where NUMBER is the section's number within its parent section (or
+        # the tree root) and DEPTH is the number of sections in its
+        # 'section_path()'.  The index follows the 'sections()' methods of
+        # 'Container' and 'Section'.  If any container in the tree overrides
+        # them, the index is empty and the callers compute the values directly.
+        root = self
+        while root._container is not None:
+            root = root._container
+        index = root._section_index
+        if index is None:
+            sections = {}
+            positions = {}
+            overridden = []
+
+            def add(container, subsections, depth):
+                for c in container._content:
+                    if isinstance(c, Section):
+                        if c.__class__.sections is not Section.sections:
+                            overridden.append(c)
+                        subsections.append(c)
+                        positions[c] = (len(subsections), depth + 1)
+                        sections[c] = []
+                        add(c, sections[c], depth + 1)
+                    elif isinstance(c, Container):
+                        if c.__class__.sections is not Container.sections:
+                            overridden.append(c)
+                        add(c, subsections, depth)
+            if isinstance(root, Section):
+                positions[root] = (1, 1)
+                sections[root] = []
+                add(root, sections[root], 1)
+            elif isinstance(root, Container):
+                sections[root] = []
+                add(root, sections[root], 0)
+            if overridden:
+                sections, positions = {}, {}
+            index = root._section_index = (sections, positions)
+        return index
+
+    def _sibling_index(self, content):
+        # Return the index of this element in 'content' of its container.
+        index = self._position
+        if index is None or index >= len(content) or content[index] is not self:
+            # The element was not attached by the 'Container' constructor.
+            index = content.index(self)
+        return index
+
     def _neighbor_element(self, direction, stop_classes):
         element = self
         container = self.container()
@@ -179,7 +278,7 @@ class Content(object):
             if container is None:
                 return None
             content = container.content()
-            index = content.index(element)
+            index = element._sibling_index(content)
             if direction < 0:
                 if index > 0:
                     neighbor = content[index - 1]
@@ -207,6 +306,29 @@ class Content(object):
         """ """
         return self._neighbor_element(1, stop_classes)
 
+    def preceding_siblings(self):
+        """Return an iterator over elements preceding this element in its container.
+
+        The elements are returned in reverse order (the nearest one first).
+        Nothing is returned for an element which is not in a container.
+
+        """
+        if self._container is not None:
+            content = self._container.content()
+            for i in range(self._sibling_index(content) - 1, -1, -1):
+                yield content[i]
+
+    def following_siblings(self):
+        """Return an iterator over elements following this element in its container.
+
+        Nothing is returned for an element which is not in a container.
+
+        """
+        if self._container is not None:
+            content = self._container.content()
+            for i in range(self._sibling_index(content) + 1, len(content)):
+                yield content[i]
+
     def sections(self):
         """Return the contained sections as a list of 'Section' instances.
 
@@ -259,6 +381,11 @@ class Container(Content):
     hierarchy.
 
     """
+
+    __slots__ = (
+        '_id', '_names', '_role', '_label', '_halign', '_valign', '_orientation', '_width',
+        '_height', '_padding', '_presentation', '_contained_resources', '_content'
+    )
     _ALLOWED_CONTENT = Content
     _SUBSEQUENCES = False
     _SUBSEQUENCE_LENGTH = None
@@ -360,13 +487,15 @@ class Container(Content):
             assert lcg.is_sequence_of(content, self._ALLOWED_CONTENT), \
                 "Not a '%s' instances sequence: %s" % (self._ALLOWED_CONTENT, content)
             self._content = tuple(content)
-            for c in content:
+            for i, c in enumerate(content):
                 c.set_container(self)
+                c._position = i
         else:
             assert isinstance(content, self._ALLOWED_CONTENT), \
                 "Not a '%s' instance: %s" % (self._ALLOWED_CONTENT, content)
             self._content = (content,)
             content.set_container(self)
+            content._position = 0
 
     def content(self):
         """Return the sequence of contained content elements.
@@ -378,6 +507,10 @@ class Container(Content):
         return self._id
 
     def sections(self):
+        if self._container is None:
+            sections, positions = self._root_section_index()
+            if self in sections:
+                return list(sections[self])
         result = []
         for c in self._content:
             if isinstance(c, Section):
@@ -446,32 +579,34 @@ class Container(Content):
 
 class Strong(Container):
     """Text emphasized by bold font face."""
-    pass
+    __slots__ = ()
 
 
 class Emphasized(Container):
     """Text emphasized by slanted font face."""
-    pass
+    __slots__ = ()
 
 
 class Underlined(Container):
     """Underlined text."""
-    pass
+    __slots__ = ()
 
 
 class Code(Container):
     """Text representing a piece of computer code."""
-    pass
+    __slots__ = ()
 
 
 class Citation(Container):
     """Citation of a text in another language."""
-    pass
+    __slots__ = ()
 
 
 class Quotation(Container):
     """Quotation of content from other source."""
 
+    __slots__ = ('_source', '_uri')
+
     def __init__(self, content, source=None, uri=None, **kwargs):
         """Arguments:
 
@@ -498,17 +633,19 @@ class Quotation(Container):
 
 class Superscript(Container):
     """Text vertically aligned above the normal line level."""
-    pass
+    __slots__ = ()
 
 
 class Subscript(Container):
     """Text vertically aligned below the normal line level."""
-    pass
+    __slots__ = ()
 
 
 class TextContent(Content):
     """A simple piece of text."""
 
+    __slots__ = ('_text',)
+
     def __init__(self, text, **kwargs):
         """Initialize the instance.
 
@@ -553,6 +690,8 @@ class TextContent(Content):
 class Link(Container):
     """Link to internal or external location."""
 
+    __slots__ = ('_target', '_descr', '_type', '_uri', '_title')
+
     class ExternalTarget(object):
         """Representation of an external target specified by its URI."""
 
@@ -663,6 +802,8 @@ class Link(Container):
 class Abbreviation(TextContent):
     """Abbreviation with description."""
 
+    __slots__ = ('_descr',)
+
     def __init__(self, text, descr, **kwargs):
         """Arguments:
 
@@ -682,6 +823,8 @@ class Abbreviation(TextContent):
 class Anchor(TextContent):
     """Target of a link (an anchor)."""
 
+    __slots__ = ('_anchor',)
+
     def __init__(self, anchor, text='', **kwargs):
         """Arguments:
 
@@ -701,6 +844,8 @@ class Anchor(TextContent):
 class _InlineObject(Content):
     """Super class for embedded objects, such as images, audio and video."""
 
+    __slots__ = ('_title', '_descr', '_name')
+
     def __init__(self, title=None, descr=None, name=None, lang=None):
         """Arguments:
 
@@ -758,6 +903,8 @@ class InlineImage(_InlineObject):
 
     """
 
+    __slots__ = ('_image', '_align', '_width', '_height', '_standalone')
+
     LEFT = 'left'
     RIGHT = 'right'
     TOP = 'top'
@@ -830,6 +977,8 @@ class InlineAudio(_InlineObject):
 
     """
 
+    __slots__ = ('_audio', '_image')
+
     def __init__(self, audio, image=None, **kwargs):
         """Arguments:
 
@@ -872,6 +1021,8 @@ class InlineVideo(_InlineObject):
 
     """
 
+    __slots__ = ('_video', '_image', '_size')
+
     def __init__(self, video, image=None, size=None, **kwargs):
         """Arguments:
 
@@ -921,6 +1072,8 @@ class InlineExternalVideo(Content):
 
     """
 
+    __slots__ = ('_service', '_video_id', '_title', '_descr', '_size')
+
     def __init__(self, service, video_id, title=None, descr=None, size=None, lang=None):
         """Arguments:
 
@@ -978,6 +1131,8 @@ class Title(Content):
 
     """
 
+    __slots__ = ('_id',)
+
     def __init__(self, id=None):
         """Arguments:
 
@@ -1004,6 +1159,8 @@ class HorizontalSeparator(Content):
 
     """
 
+    __slots__ = ('_thickness', '_color')
+
     def __init__(self, thickness=None, color=None, **kwargs):
         """Arguments:
         thickness -- Thickness of the line as 'lcg.Unit' or None for the (media
@@ -1026,12 +1183,12 @@ class HorizontalSeparator(Content):
 
 class NewPage(Content):
     """New page starts here."""
-    pass
+    __slots__ = ()
 
 
 class NewLine(Content):
     """Explicit line break."""
-    pass
+    __slots__ = ()
 
 
 class PageNumber(Content):
@@ -1043,6 +1200,8 @@ class PageNumber(Content):
 
     """
 
+    __slots__ = ('_total', '_separator')
+
     def __init__(self, total=False, separator=None, lang=None):
         """
         Arguments:
@@ -1075,7 +1234,7 @@ class PageHeading(Content):
     This content may be used only inside page headers and footers.
 
     """
-    pass
+    __slots__ = ()
 
 
 class HSpace(Content):
@@ -1087,6 +1246,8 @@ class HSpace(Content):
 
     """
 
+    __slots__ = ('_size',)
+
     def __init__(self, size, lang=None):
         """
         @type: L{lcg.Unit}
@@ -1112,6 +1273,8 @@ class VSpace(HSpace):
 
     """
 
+    __slots__ = ()
+
 
 class HtmlContent(Content):
     """Special element for dirtect HTML embedding in LCG content hierarchy.
@@ -1137,6 +1300,8 @@ class HtmlContent(Content):
 
     """
 
+    __slots__ = ('_content', '_export_args')
+
     def __init__(self, content, *args, **kwargs):
         """Initialize the instance.
 
@@ -1174,6 +1339,8 @@ class Heading(Container):
 
     """
 
+    __slots__ = ('_level',)
+
     def __init__(self, content, level, **kwargs):
         """
         Arguments:
@@ -1196,6 +1363,8 @@ class Heading(Container):
 class PreformattedText(TextContent):
     """Preformatted text."""
 
+    __slots__ = ('_mime_type',)
+
     def __init__(self, text, mime_type=None, **kwargs):
         """Arguments:
 
@@ -1222,6 +1391,8 @@ SectionContainer = Container
 class Paragraph(Container):
     """A paragraph of text, where the text can be any 'Content'."""
 
+    __slots__ = ('_noindent',)
+
     def __init__(self, content, noindent=False, **kwargs):
         """Arguments:
 
@@ -1243,6 +1414,8 @@ class Paragraph(Container):
 class ItemizedList(Container):
     """An itemized list."""
 
+    __slots__ = ('_order',)
+
     NUMERIC = 'numeric'
     LOWER_ALPHA = 'lower-alpha'
     UPPER_ALPHA = 'upper-alpha'
@@ -1271,6 +1444,8 @@ class DefinitionList(Container):
     DESCRIPTION)', where both items are 'Content' instances.
 
     """
+
+    __slots__ = ()
     _SUBSEQUENCES = True
     _SUBSEQUENCE_LENGTH = 2
 
@@ -1285,12 +1460,16 @@ class FieldSet(Container):
     term).
 
     """
+
+    __slots__ = ()
     _SUBSEQUENCES = True
     _SUBSEQUENCE_LENGTH = 2
 
 
 class TableCell(Container):
     """Table cell is a container of cell content and may appear within 'TableRow'."""
+
+    __slots__ = ('_align',)
     LEFT = lcg.HorizontalAlignment.LEFT
     RIGHT = lcg.HorizontalAlignment.RIGHT
     CENTER = lcg.HorizontalAlignment.CENTER
@@ -1314,11 +1493,13 @@ class TableCell(Container):
 
 class TableHeading(TableCell):
     """Table heading is a container of heading content and may appear within 'TableRow'."""
-    pass
+    __slots__ = ()
 
 
 class TableRow(Container):
     """Table row is a container of cells or headings and may appear within 'Table'."""
+
+    __slots__ = ('_line_above', '_line_below', '_iterated')
     _ALLOWED_CONTENT = (TableCell, TableHeading)
 
     def __init__(self, content, line_above=None, line_below=None, iterated=False, **kwargs):
@@ -1351,6 +1532,8 @@ class TableRow(Container):
 
 class Table(Container):
     """Table is a container of 'TableRow' instances."""
+
+    __slots__ = ('_title', '_long', '_column_widths', '_bars', '_compact', '_transformations')
     _ALLOWED_CONTENT = (TableRow, HorizontalSeparator,)
 
     def __init__(self, content, title=None, long=False, column_widths=None, bars=(),
@@ -1448,6 +1631,8 @@ class Section(Container):
         container.
 
     """
+
+    __slots__ = ('_title', '_in_toc', '_descr', '_heading', '_heading_element')
     _ID_PREFIX = 'sec'
 
     def __init__(self, title, content, heading=None, id=None, anchor=None,
@@ -1479,6 +1664,7 @@ class Section(Container):
         self._in_toc = in_toc
         self._descr = descr
         self._heading = heading or TextContent(title)
+        self._heading_element = None
         super(Section, self).__init__(content, id=id, **kwargs)
 
     def section_path(self):
@@ -1504,10 +1690,31 @@ class Section(Container):
 
         Return the content passed as 'heading' argument wrapped in the
         'Heading' element (denoting the actual section heading level depending
-        on section position in the document).
+        on section position in the document).  The same instance is returned
+        by repeated calls as long as the heading level doesn't change.
 
         """
-        return Heading(self._heading, level=len(self.section_path()) + 1)
+        level = self._depth() + 1
+        heading = self._heading_element
+        if heading is None or heading.level() != level:
+            # The level only changes if the section is moved within a bigger tree.
+            heading = self._heading_element = Heading(self._heading, level=level)
+        return heading
+
+    def _depth(self):
+        # Return the length of 'section_path()'.
+        sections, positions = self._root_section_index()
+        try:
+            return positions[self][1]
+        except KeyError:
+            return len(self.section_path())
+
+    def sections(self):
+        sections, positions = self._root_section_index()
+        try:
+            return list(sections[self])
+        except KeyError:
+            return super(Section, self).sections()
 
     def in_toc(self):
         """Return true if the section is supposed to appear in TOC."""
@@ -1532,6 +1739,20 @@ class Section(Container):
             else:
                 return 1
         if self._id is None:
+            sections, positions = self._root_section_index()
+            try:
+                number, depth = positions[self]
+            except KeyError:
+                pass
+            else:
+                if depth >= 2:
+                    parent = self._container
+                    while not isinstance(parent, Section):
+                        parent = parent._container
+                    self._id = parent.id() + '.' + unistr(number)
+                else:
+                    self._id = self._ID_PREFIX + unistr(number)
+                return self._id
             path = self.section_path()
             if len(path) >= 2:
                 self._id = path[-2].id() + '.' + unistr(section_number(self))
@@ -1558,6 +1779,8 @@ class TableOfContents(Content):
     See also the 'NodeIndex' class if you need to display a hierarchy of nodes.
 
     """
+
+    __slots__ = ('_item', '_title', '_depth', '_detailed')
     _TOC_ITEM_TYPE = Content
 
     def __init__(self, item=None, title=None, depth=None, detailed=True, **kwargs):
@@ -1648,6 +1871,8 @@ class NodeIndex(TableOfContents):
     default displays only nodes, not their inner conent (detailed=False).
 
     """
+
+    __slots__ = ()
     _TOC_ITEM_TYPE = lcg.ContentNode
 
     def __init__(self, title=None, node=None, depth=None, detailed=False):
@@ -1660,6 +1885,8 @@ class NodeIndex(TableOfContents):
 class RootIndex(NodeIndex):
     """'NodeIndex' starting from the top level node of the whole tree."""
 
+    __slots__ = ()
+
     def _root_item(self):
         return self.parent().root()
 
@@ -1672,7 +1899,7 @@ class NoneContent(Content):
     same purpose.
 
     """
-    pass
+    __slots__ = ()
 
 
 class SetVariable(Content):
@@ -1684,6 +1911,8 @@ class SetVariable(Content):
 
     """
 
+    __slots__ = ('_name', '_value')
+
     def __init__(self, name, value, **kwargs):
         """
         Arguments:
@@ -1710,6 +1939,8 @@ class SetVariable(Content):
 class Substitution(Content):
     """Variable to be substituted by the actual value on export."""
 
+    __slots__ = ('_name', '_markup')
+
     def __init__(self, name, markup=None, **kwargs):
         """
         Arguments:
@@ -1739,6 +1970,8 @@ class Substitution(Content):
 class Figure(Container):
     """A container that can have a caption, typicaly for images"""
 
+    __slots__ = ('_caption', '_align')
+
     LEFT = 'left'
     RIGHT = 'right'
 
@@ -1772,6 +2005,9 @@ class MathML(Content):
     It is expected that the MathML content is a presentation form of MathML 3.
 
     """
+
+    __slots__ = ('_content',)
+
     class EntityHandler(object):
         """Entity dictionary to be used in 'tree_content()' method.
 
@@ -1969,6 +2205,9 @@ class InlineSVG(Content):
     output is used.
 
     """
+
+    __slots__ = ('_content', '_export_args')
+
     def __init__(self, content, *args, **kwargs):
         """Initialize the instance.
 
@@ -1997,8 +2236,62 @@ class InlineSVG(Content):
             content = content.encode('utf-8')
         return content
 
+
 # Convenience functions for simple content construction.
 
+_INTERNED_TEXTS = {}
+_INTERNED_TEXTS_LIMIT = 10000
+
+
+def intern_text(text):
+    """Return a shared instance of a string equal to 'text'.
+
+    Generated content often contains many identical texts (table cells,
+    labels, separators...).  Content elements can not be shared, because
+    each element has its own container, but the texts they hold can.  This
+    function returns the first instance of a plain string or a 'Localizable'
+    equal to 'text' seen since the pool was last emptied, so that all
+    'TextContent' elements created from equal texts refer to the same string.
+
+    'Localizable' instances are considered equal when they are of the same
+    class and were created with the same constructor arguments.  Instances
+    created with arguments other than plain strings, numbers and None (such
+    as interpolation with nested 'Localizable' values or text transformation
+    functions) are returned as is.  So are instances of other string types.
+
+    The pool is emptied when it reaches its size limit to avoid holding texts
+    of documents which are not needed anymore.
+
+    """
+    if type(text) is unistr:
+        key = text
+    elif isinstance(text, lcg.Localizable):
+        args = text._clone_args()
+        kwargs = text._clone_kwargs()
+        if not all(_internable_value(v) for v in args + tuple(kwargs.values())):
+            return text
+        # Values of different types may be equal (1 == True == 1.0 or str and
+        # unicode in Python 2), so the types are a part of the key too.
+        key = (text.__class__, tuple((type(v), v) for v in args),
+               tuple(sorted((k, type(v), v) for k, v in kwargs.items())))
+    else:
+        return text
+    try:
+        return _INTERNED_TEXTS[key]
+    except KeyError:
+        if len(_INTERNED_TEXTS) >= _INTERNED_TEXTS_LIMIT:
+            _INTERNED_TEXTS.clear()
+        _INTERNED_TEXTS[key] = text
+        return text
+
+
+def _internable_value(value):
+    # Only values which are equal iff they are the same text or number of
+    # the same type.
+    return value is None or value == () and isinstance(value, tuple) or \
+        type(value) in (unistr, str, bool, int, float)
+
+
 def coerce(content, formatted=False):
     """Coerce the argument into an LCG content element.
 
@@ -2033,7 +2326,7 @@ def coerce(content, formatted=False):
             from lcg import Parser
             return Parser().parse_inline_markup(content)
         else:
-            return TextContent(content)
+            return TextContent(intern_text(content))
     else:
         assert isinstance(content, Content), ('Invalid content', content,)
         return content
@@ -2041,11 +2334,12 @@ def coerce(content, formatted=False):
 
 def join(items, separator=' '):
     """Coerce all items and put the coerced separator in between them."""
-    sep = coerce(separator)
     result = []
     for item in items:
         if result:
-            result.append(sep)
+            # A string separator is coerced for each position to get distinct
+            # elements (each has its own container) sharing the same text.
+            result.append(coerce(separator))
         result.append(coerce(item))
     return coerce(result)
 
@@ -283,8 +283,15 @@ class ExerciseParser(object):
     _BLANK_LINE_SPLITTER = re.compile(r"\r?\n\s*\r?\n")
     _GAP_MATCHER = re.compile(r"(___+)")
 
-    def __init__(self):
-        self._parser = lcg.Parser()
+    def __init__(self, parser=None):
+        """Arguments:
+
+          parser -- 'lcg.Parser' instance used to parse inline markup within
+            exercise texts or None to create a new one.  Pass a parser with
+            inline cache enabled to reuse parsed answers, labels etc.
+
+        """
+        self._parser = parser or lcg.Parser()
 
     def _error(self, *args, **kwargs):
         raise self.ExerciseParserError(*args, **kwargs)
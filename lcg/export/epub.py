@@ -196,7 +196,8 @@ class EpubExporter(lcg.Exporter):
     def __init__(self, *args, **kwargs):
         kwargs.pop('force_lang_ext', None)
         super(EpubExporter, self).__init__(*args, **kwargs)
-        self._html_exporter = EpubXhtmlExporter(translations=self._translation_path)
+        self._html_exporter = EpubXhtmlExporter(translations=self._translation_path,
+                                                catalog_dir=self._catalog_dir)
 
     def dump(self, node, directory, filename=None, variant=None, **kwargs):
         variants = (variant,) if variant else node.variants() or (None,)
@@ -33,10 +33,15 @@ from builtins import range
 from past.utils import old_div
 
 from contextlib import contextmanager
+import hashlib
+import io
+import multiprocessing
 import os
+import pickle
 import re
 import shutil
 import sys
+import tempfile
 
 import lcg
 
@@ -137,6 +142,27 @@ class SubstitutionIterator(object):
         pass
 
 
+class _TocElementList(list):
+    """List of table of contents elements returned by the deprecated 'toc_elements'.
+
+    The elements appended to the list are registered in the export context
+    by 'add_toc_element()'.
+
+    """
+
+    def __init__(self, context, elements):
+        super(_TocElementList, self).__init__(elements)
+        self._context = context
+
+    def append(self, element):
+        super(_TocElementList, self).append(element)
+        self._context.add_toc_element(element)
+
+    def extend(self, elements):
+        for element in elements:
+            self.append(element)
+
+
 class Exporter(object):
     """Transforming structured content objects to various output formats.
 
@@ -207,6 +233,10 @@ class Exporter(object):
             """
             self._exporter = exporter
             self._node = node
+            # Elements by the TOC markers already written into the output.  Kept
+            # apart from '_toc_elements' below: one element may get several
+            # markers and the markers must stay resolvable after the set of TOC
+            # elements is replaced by 'set_toc_elements()'.
             self._toc_markers = {}
             self._secondary_language_active = False
             self.position_info = []
@@ -215,7 +245,11 @@ class Exporter(object):
             self.list_level = 0
             self.max_list_level = 0
             self.text_preprocessor = None
-            self.toc_elements = ()
+            # Table of contents elements by their id() (elements are distinguished by identity).
+            self._toc_elements = {}
+            # List assigned to the deprecated 'toc_elements' attribute (its
+            # owner may still append to it) or None.
+            self._assigned_toc_elements = None
 
         def _init_kwargs(self, lang, sec_lang=None, log=None, presentation=None, timezone=None,
                          text_preprocessor=None):
@@ -272,6 +306,9 @@ class Exporter(object):
         def localize(self, text):
             return self._localizer.localize(text)
 
+        def localize_chunks(self, text, **kwargs):
+            return self._localizer.localize_chunks(text, **kwargs)
+
         translate = localize  # For backwards compatibility...
 
         def presentation(self):
@@ -285,6 +322,43 @@ class Exporter(object):
         def uri(self, target, **kwargs):
             return self._exporter.uri(self, target, **kwargs)
 
+        def is_toc_element(self, element):
+            """Return true iff 'element' is referred from the table of contents."""
+            if id(element) in self._toc_elements:
+                return True
+            assigned = self._assigned_toc_elements
+            return assigned is not None and any(e is element for e in assigned)
+
+        def add_toc_element(self, element):
+            """Register 'element' as referred from the table of contents.
+
+            Table of contents elements are marked in the output by TOC markers
+            when exported (see 'add_toc_marker()').
+
+            """
+            self._toc_elements[id(element)] = element
+
+        def set_toc_elements(self, elements):
+            """Replace all registered table of contents elements by 'elements' (a sequence)."""
+            self._toc_elements = dict((id(element), element) for element in elements)
+            self._assigned_toc_elements = None
+
+        def _get_toc_elements(self):
+            elements = list(self._toc_elements.values())
+            if self._assigned_toc_elements is not None:
+                elements.extend(e for e in self._assigned_toc_elements
+                                if id(e) not in self._toc_elements)
+            return _TocElementList(self, elements)
+
+        def _set_toc_elements(self, elements):
+            self.set_toc_elements(elements)
+            if isinstance(elements, list):
+                # Support the former usage: context.toc_elements = []; ...append(element)
+                self._assigned_toc_elements = elements
+
+        toc_elements = property(_get_toc_elements, _set_toc_elements,
+                                doc="Deprecated.  Use 'is_toc_element()' and 'add_toc_element()'.")
+
         def toc_element(self, marker):
             return self._toc_markers[marker]
 
@@ -341,9 +415,14 @@ class Exporter(object):
             """
             return self._messages
 
-    def __init__(self, translations=()):
+    def __init__(self, translations=(), catalog_dir=None):
         self._translation_path = translations
+        self._catalog_dir = catalog_dir
         self._export_method = self._define_export_methods()
+        # Export methods resolved for particular element classes (including
+        # classes not present in '_export_method' directly).
+        self._resolved_export_method = dict(self._export_method)
+        self._localizers = {}
 
     def _uri_node(self, context, node, lang=None):
         return node.id()
@@ -465,8 +544,21 @@ class Exporter(object):
         return method(context, target, **kwargs)
 
     def localizer(self, lang, timezone=None):
-        """Return a 'lcg.Localizer' instance for given language and time zone."""
-        return lcg.Localizer(lang, timezone=timezone, translation_path=self._translation_path)
+        """Return a 'lcg.Localizer' instance for given language and time zone.
+
+        The same instance is returned for the same arguments, so that its
+        localization cache is shared by all exported pages.
+
+        """
+        key = (lang, timezone)
+        try:
+            localizer = self._localizers[key]
+        except KeyError:
+            localizer = self._localizers[key] = lcg.Localizer(
+                lang, timezone=timezone, translation_path=self._translation_path,
+                catalog_dir=self._catalog_dir,
+            )
+        return localizer
 
     translator = localizer
     """Deprecated backwards compatibility alias - please use 'localizer' instead."""
@@ -487,6 +579,16 @@ class Exporter(object):
         """
         return self.Context(self, node, lang, **kwargs)
 
+    def _resolve_export_method(self, cls):
+        for base in cls.__mro__:
+            try:
+                method = self._export_method[base]
+            except KeyError:
+                continue
+            self._resolved_export_method[cls] = method
+            return method
+        raise UnsupportedElementType(cls)
+
     def export_element(self, context, element):
         """Export the given content element and return its output representation.
 
@@ -497,7 +599,8 @@ class Exporter(object):
           element -- 'Content' instance to be exported.
 
         The supported element types are defined by the method '_define_export_methods()'.  If the
-        'element' class is not found there directly, all its base classes are searched.
+        'element' class is not found there directly, its base classes are searched in the method
+        resolution order.  The result is remembered for each class.
 
         """
         if element.parent() is None:
@@ -506,21 +609,12 @@ class Exporter(object):
             # removed alltogether.
             element.set_parent(context.node())
         cls = element.__class__
-        if cls not in self._export_method:
-            def base_classes(cls):
-                result = list(cls.__bases__)
-                for x in result:
-                    result.extend(base_classes(x))
-                return result
-            bases = base_classes(cls)
-            while bases and cls not in self._export_method:
-                cls = bases.pop(0)
         try:
-            method = self._export_method[cls]
+            method = self._resolved_export_method[cls]
         except KeyError:
-            raise UnsupportedElementType(element.__class__)
+            method = self._resolve_export_method(cls)
         exported = method(context, element)
-        if element in context.toc_elements:
+        if context.is_toc_element(element):
             toc_marker = context.add_toc_marker(element)
             exported = self.concat(self._marker(self._TOC_MARKER_CHAR, toc_marker), exported)
         return exported
@@ -1015,11 +1109,12 @@ class Exporter(object):
         presentation = presentation_set and presentation_set.presentation(None, lang)
         page_width = presentation and presentation.page_width
         item_list = []
-        node_list = context.toc_elements = []
+        context.set_toc_elements(())
 
         def export(items):
             for node, subitems in items:
-                node_list.append(node.heading() if isinstance(node, lcg.ContentNode) else node)
+                context.add_toc_element(node.heading() if isinstance(node, lcg.ContentNode)
+                                        else node)
                 current_lang = (node.lang() or lang)
                 if isinstance(node, lcg.Section):
                     item_list.append(self.text(context, node.title(), lang=current_lang,
@@ -1379,21 +1474,89 @@ class FileExporter(object):
 
     _OUTPUT_FILE_EXT = None
 
-    def __init__(self, force_lang_ext=False, **kwargs):
+    def __init__(self, force_lang_ext=False, skip_unchanged=False, **kwargs):
+        """Initialize the exporter.
+
+        Arguments:
+
+          force_lang_ext -- if true, all output files have the language
+            extension.  By default, the extension is only added if the node has
+            more than one language variant.
+          skip_unchanged -- if true, existing output files are only replaced
+            when their content changes.  The new output is written into a
+            temporary file and compared with the existing file by its SHA-1
+            hash.  Unchanged files are left untouched (including their
+            modification time).
+
+        Other arguments are passed to the parent class constructor.  See also
+        'changed_files()'.
+
+        """
         super(FileExporter, self).__init__(**kwargs)
         self._force_lang_ext = force_lang_ext
+        self._skip_unchanged = skip_unchanged
+        self._changed_files = []
+
+    def _file_digest(self, filename):
+        digest = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _make_directory(self, directory):
+        # Create 'directory' if it doesn't exist.  It may also be created at
+        # the same time by another process (see '_dump_parallel()').
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
 
     def _write_file(self, filename, content):
+        # 'content' is a string or an iterable of strings written one by one.
+        # The output is written into a temporary file which only replaces
+        # 'filename' when complete, so the previous file is left intact when
+        # the export fails.
         directory = os.path.split(filename)[0]
-        if directory and not os.path.isdir(directory):
-            os.makedirs(directory)
-        if isinstance(content, unistr):
-            content = content.encode('utf-8')
-        file = open(filename, 'wb')
+        if directory:
+            self._make_directory(directory)
+        if isinstance(content, (basestring, bytes)):
+            content = (content,)
+        exists = os.path.exists(filename)
+        digest = hashlib.sha1() if self._skip_unchanged and exists else None
+        fd, output = tempfile.mkstemp(dir=directory or None,
+                                      prefix='.' + os.path.basename(filename) + '.')
         try:
-            file.write(content)
-        finally:
-            file.close()
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content:
+                    if isinstance(chunk, unistr):
+                        chunk = chunk.encode('utf-8')
+                    if digest is not None:
+                        digest.update(chunk)
+                    f.write(chunk)
+            if digest is not None:
+                if (os.path.getsize(output) == os.path.getsize(filename) and
+                        digest.hexdigest() == self._file_digest(filename)):
+                    os.remove(output)
+                    return
+            if exists:
+                shutil.copymode(filename, output)
+                if os.name == 'nt':
+                    # Renaming doesn't replace existing files on Windows.
+                    os.remove(filename)
+            else:
+                # Temporary files are only accessible by the owner.
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(output, 0o666 & ~umask)
+            os.rename(output, filename)
+        except Exception:
+            # Don't leave an incomplete file behind.
+            if os.path.exists(output):
+                os.remove(output)
+            raise
+        self._changed_files.append(filename)
 
     def _filename(self, node, context, lang=None):
         """Return the pathname of node's output file relative to the output directory."""
@@ -1418,12 +1581,140 @@ class FileExporter(object):
                     lcg.log(_("%s: file created.", outfile))
         elif (not os.path.exists(outfile) or
               os.path.exists(infile) and os.path.getmtime(outfile) < os.path.getmtime(infile)):
-            if not os.path.isdir(os.path.dirname(outfile)):
-                os.makedirs(os.path.dirname(outfile))
+            self._make_directory(os.path.dirname(outfile))
             shutil.copyfile(infile, outfile)
+            self._changed_files.append(outfile)
             lcg.log(_("%s: file copied.", outfile))
 
-    def dump(self, node, directory, filename=None, variant=None, recursive=False,
+    def _dump_output(self, context, **kwargs):
+        # Return the output written by 'dump()' for given context.  It may be
+        # an 'lcg.Rope', which is localized and written without joining it.
+        return self.export(context, **kwargs)
+
+    def _dump_node(self, node, directory, filename=None, variant=None, recursive=False,
+                   **kwargs):
+        # Write the output file(s) as described in 'dump()' and return the
+        # list of messages logged during the export as pairs (KIND, MESSAGE).
+        messages = []
+        variants = variant and (variant,) or node.variants() or (None,)
+        for lang in variants:
+            context = self.context(node, lang, **kwargs)
+            export_kwargs = {}
+            if recursive:
+                export_kwargs['recursive'] = True
+            # The localized output is written gradually, so the whole
+            # localized document is never held in memory.  If the output is a
+            # rope, it is not joined into one string either.
+            data = context.localize_chunks(self._dump_output(context, **export_kwargs))
+            if filename:
+                fn = filename
+            else:
+                fn = self._filename(node, context)
+            self._write_file(os.path.join(directory, fn), data)
+            messages.extend(context.messages() or ())
+        return messages
+
+    def _dump_task(self, node, directory, kwargs):
+        # Perform one task of '_dump_parallel()' (in a worker process).  The
+        # output written to STDERR meanwhile (such as by 'lcg.log()') is
+        # captured and returned to be written out by the parent process.
+        changed = len(self._changed_files)
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            messages = self._dump_node(node, directory, **kwargs)
+            resources = []
+            for resource in node.resources():
+                try:
+                    pickle.dumps(resource)
+                except Exception:
+                    # Resources which can't be passed back to the parent process
+                    # (such as those with file-like content) are exported here.
+                    self._export_resource(resource, directory)
+                else:
+                    resources.append(resource)
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        return output, messages, resources, self._changed_files[changed:]
+
+    def _dump_parallel(self, tasks, directory, jobs):
+        """Perform given dump tasks in parallel worker processes and return the resources.
+
+        Arguments:
+
+          tasks -- sequence of pairs (NODE, KWARGS), where KWARGS are keyword
+            arguments of '_dump_node()' for given 'ContentNode' NODE (such as
+            the language 'variant').
+          directory -- name of the destination directory as a string.
+          jobs -- maximal number of worker processes.
+
+        The messages logged by each task (including the output written to
+        STDERR by 'lcg.log()') are written to STDERR in the order of 'tasks'
+        (as soon as all preceding tasks are finished).  Returns the list of
+        resources allocated by the dumped nodes in the same order (possibly
+        containing duplicates).
+
+        The workers are forked, so they inherit the content trees as they are.
+        The first task is performed before forking, so that the workers also
+        inherit its state, such as the resources already looked up (thus a
+        missing resource used by all nodes is only reported once).  Where
+        forking is not available, the tasks are performed serially.
+
+        """
+        global _parallel_dump
+        if hasattr(multiprocessing, 'get_context'):
+            if 'fork' in multiprocessing.get_all_start_methods():
+                pool_class = multiprocessing.get_context('fork').Pool
+            else:
+                pool_class = None
+        else:
+            pool_class = multiprocessing.Pool if os.name == 'posix' else None
+        resources = []
+
+        def handle(result):
+            output, messages, task_resources, changed_files = result
+            sys.stderr.write(output)
+            for kind, message in messages:
+                sys.stderr.write('%s: %s\n' % (kind, message,))
+            resources.extend(task_resources)
+            self._changed_files.extend(changed_files)
+
+        def dump(node, kwargs):
+            # Perform the task in this process.
+            handle(('', self._dump_node(node, directory, **kwargs), node.resources(), ()))
+        if pool_class is None or jobs < 2 or len(tasks) < 3:
+            for node, kwargs in tasks:
+                dump(node, kwargs)
+            return resources
+        dump(*tasks[0])
+        _parallel_dump = (self, tasks, directory)
+        try:
+            pool = pool_class(min(jobs, len(tasks) - 1))
+            try:
+                for result in pool.imap(_dump_task, range(1, len(tasks))):
+                    handle(result)
+            except BaseException:
+                pool.terminate()
+                raise
+            else:
+                pool.close()
+            finally:
+                pool.join()
+        finally:
+            _parallel_dump = None
+        return resources
+
+    def changed_files(self):
+        """Return the list of output files created or changed by this exporter so far.
+
+        With 'skip_unchanged', the files with unchanged content are not
+        included, so the list may be used to deploy just the changes.
+
+        """
+        return list(self._changed_files)
+
+    def dump(self, node, directory, filename=None, variant=None, recursive=False, jobs=None,
              **kwargs):
         """Write node's content into the output file.
 
@@ -1440,25 +1731,37 @@ class FileExporter(object):
              written.
            recursive -- iff true, perform recursive export, i.e. export the
              whole set of documents
+           jobs -- number of processes used to export the language variants
+             in parallel (see '_dump_parallel()').  None or 1 means exporting
+             serially in the current process.  The messages logged during the
+             export are written in the order of variants in both cases.  When
+             'filename' is given, the variants are exported serially, since
+             they are all written into the same file.
 
         All other keyword arguments will be passed to the exporter context
         constructor (See the .
 
         """
-        variants = variant and (variant,) or node.variants() or (None,)
-        for lang in variants:
-            context = self.context(node, lang, **kwargs)
-            export_kwargs = {}
-            if recursive:
-                export_kwargs['recursive'] = True
-            data = context.localize(self.export(context, **export_kwargs))
-            if filename:
-                fn = filename
-            else:
-                fn = self._filename(node, context)
-            self._write_file(os.path.join(directory, fn), data)
-            for kind, message in context.messages():
-                sys.stderr.write('%s: %s\n' % (kind, message,))
+        if (jobs is not None and jobs > 1 and not variant and not filename and
+                len(node.variants()) > 1):
+            tasks = [(node, dict(kwargs, filename=filename, variant=lang, recursive=recursive))
+                     for lang in node.variants()]
+            self._dump_parallel(tasks, directory, jobs)
+            return
+        for kind, message in self._dump_node(node, directory, filename=filename,
+                                             variant=variant, recursive=recursive, **kwargs):
+            sys.stderr.write('%s: %s\n' % (kind, message,))
+
+
+_parallel_dump = None
+"""The state of the running 'FileExporter._dump_parallel()' inherited by the worker processes."""
+
+
+def _dump_task(index):
+    # Worker process function of 'FileExporter._dump_parallel()'.
+    exporter, tasks, directory = _parallel_dump
+    node, kwargs = tasks[index]
+    return exporter._dump_task(node, directory, kwargs)
 
 
 class UnsupportedElementType(Exception):
@@ -78,7 +78,7 @@ class HtmlEscapedUnicode(unistr):
         return super(HtmlEscapedUnicode, cls).__new__(cls, value)
 
     def __add__(self, other):
-        if isinstance(other, lcg.Localizable):
+        if isinstance(other, (lcg.Localizable, lcg.Rope)):
             result = concat(self, other)
         else:
             result = self.__class__(unistr(self) + unistr(other), escape=False)
@@ -163,14 +163,19 @@ class HtmlGenerator(object):
                            '\n': '\\n'}
     _JAVASCRIPT_ESCAPE_REGEX = re.compile(r'[<>&"\'\n\\]')
 
-    def __init__(self, sorted_attributes=False):
+    def __init__(self, sorted_attributes=False, rope_size=None):
         """Arguments:
 
           sorted_attributes -- set to True when deterministic attribute order in HTML tags
             is needed (mostly useful for unit testing).
+          rope_size -- if not None, the generated HTML longer than given number
+            of characters is returned as 'lcg.Rope' rather than joined into a
+            string.  Large nested output is then joined only once at the end
+            rather than at each nesting level.
 
         """
         self._sorted_attributes = sorted_attributes
+        self._rope_size = rope_size
 
     def _js_escape_char(self, match):
         return self._JAVASCRIPT_ESCAPES[match.group(0)]
@@ -216,7 +221,7 @@ class HtmlGenerator(object):
         else:
             assert content is None, "Non-empty non-paired content"
             result.append(self.noescape('/>'))
-        if dirty:
+        if dirty or self._rope_size is not None and content and len(content) > self._rope_size:
             return self.concat(*result)
         else:
             return self.noescape(''.join(result))
@@ -265,7 +270,7 @@ class HtmlGenerator(object):
         return HtmlEscapedUnicode(text, escape=False)
 
     def _concat_escape(self, element):
-        if isinstance(element, lcg.Concatenation):
+        if isinstance(element, (lcg.Concatenation, lcg.Rope)):
             result = element
         elif isinstance(element, lcg.Localizable):
             if self._concat_escape not in element._transforms:
@@ -281,7 +286,12 @@ class HtmlGenerator(object):
         return result
 
     def concat(self, *items):
-        return concat(*self._concat_escape(items))
+        items = self._concat_escape(items)
+        if self._rope_size is not None:
+            rope = lcg.Rope(items)
+            if len(rope) > self._rope_size:
+                return rope
+        return concat(*items)
 
     def html(self, content, **kwargs):
         return self._tag('html', content, kwargs, allow=('xmlns',))
@@ -817,6 +827,13 @@ class HtmlExporter(lcg.Exporter):
     _MATHML_XMLNS = re.compile(r'<math[^>]* xmlns=".*')
     _ALLOW_BACKREF = True
     """Allow using back references from section titles to related TOC items (if TOC exists)."""
+    _ROPE_SIZE = 4096
+    """Length of generated HTML above which it is kept as 'lcg.Rope' during export.
+
+    The parts of the output are not joined at each nesting level, but just
+    once in 'export()' (see 'HtmlGenerator.__init__()').
+
+    """
 
     def __init__(self, *args, **kwargs):
         """Arguments:
@@ -828,7 +845,8 @@ class HtmlExporter(lcg.Exporter):
             embedded in HTML as an image (requires cairosvg to be installed).
 
         """
-        self._generator = self.Generator(sorted_attributes=kwargs.pop('sorted_attributes', False))
+        self._generator = self.Generator(sorted_attributes=kwargs.pop('sorted_attributes', False),
+                                         rope_size=self._ROPE_SIZE)
         self._allow_svg = kwargs.pop('allow_svg', True)
         self._gettext_domains = {}
         super(HtmlExporter, self).__init__(*args, **kwargs)
@@ -1555,24 +1573,34 @@ class HtmlExporter(lcg.Exporter):
             # Export body first to allocate all resources before generating the head.
             body = g.body(self._body_content(context), **self._body_attr(context))
             head = g.head(self._head(context))
-            return concat(head, body)
+            return g.concat(head, body)
         finally:
             context.position_info.pop()
 
-    def export(self, context):
+    def _document(self, context):
+        # Return the exported document, possibly as 'lcg.Rope' (see 'export()').
         g = self._generator
         if self._XHTML:
             # The XML declaration and the namespace are only valid in XHTML.  In
             # a document served as 'text/html' the declaration is not allowed at
             # all (HTML parsers treat it as a bogus comment) and the namespace is
             # meaningless.
-            return concat(g.noescape('<?xml version="1.0" encoding="UTF-8"?>\n'
-                                     '<!DOCTYPE html>\n'),
-                          g.html(self._html_content(context), lang=context.lang(),
-                                 xmlns='http://www.w3.org/1999/xhtml'))
+            return g.concat(g.noescape('<?xml version="1.0" encoding="UTF-8"?>\n'
+                                       '<!DOCTYPE html>\n'),
+                            g.html(self._html_content(context), lang=context.lang(),
+                                   xmlns='http://www.w3.org/1999/xhtml'))
         else:
-            return concat(g.noescape('<!DOCTYPE html>\n'),
-                          g.html(self._html_content(context), lang=context.lang()))
+            return g.concat(g.noescape('<!DOCTYPE html>\n'),
+                            g.html(self._html_content(context), lang=context.lang()))
+
+    def export(self, context):
+        # Large documents are generated as a rope, which is only joined here.
+        # Subclasses should override '_document()' rather than this method,
+        # since 'HtmlFileExporter' writes the rope out without joining it.
+        result = self._document(context)
+        if isinstance(result, lcg.Rope):
+            result = result.concat()
+        return result
 
 
 Html5Exporter = HtmlExporter
@@ -1587,7 +1615,43 @@ class HtmlFileExporter(lcg.FileExporter, HtmlExporter):
     def _uri_node(self, context, node, lang=None):
         return self._filename(node, context, lang=lang)
 
-    def dump(self, node, directory, filename=None, **kwargs):
+    def _dump_output(self, context, **kwargs):
+        return self._document(context)
+
+    def dump(self, node, directory, filename=None, jobs=None, **kwargs):
+        """Write the output files of 'node' and all its descendants and their resources.
+
+        Arguments:
+
+          jobs -- number of processes used to export the nodes and their
+            language variants in parallel.  None or 1 means exporting serially
+            in the current process.  In parallel export, each resource is
+            exported only once (after all nodes are exported) and the messages
+            are logged in the order of nodes.  Note that the resources
+            allocated during export in worker processes are not registered by
+            the nodes in the current process.
+
+        Other arguments are the same as for 'FileExporter.dump()'.
+
+        """
+        if jobs is not None and jobs > 1:
+            variant = kwargs.pop('variant', None)
+
+            def variants(n):
+                if variant or n is node and filename:
+                    # With an explicit filename, all variants are written into
+                    # the same file, so they are exported serially by one task.
+                    return (variant,)
+                return n.variants() or (None,)
+            tasks = [(n, dict(kwargs, filename=filename if n is node else None, variant=lang))
+                     for n in node.linear() for lang in variants(n)]
+            exported = set()
+            for r in self._dump_parallel(tasks, directory, jobs):
+                key = (r.SUBDIR, r.filename())
+                if key not in exported:
+                    exported.add(key)
+                    self._export_resource(r, directory)
+            return
         super(HtmlFileExporter, self).dump(node, directory, filename=filename, **kwargs)
         for n in node.children():
             self.dump(n, directory, **kwargs)
@@ -1684,7 +1748,7 @@ class HtmlStaticExporter(StyledHtmlExporter, HtmlFileExporter):
     def _navigation(self, context):
         node = context.node()
         root = node.root()
-        if len(root.linear()) <= 1:
+        if not root.children():
             return None
         g = self._generator
         parent = node.parent()
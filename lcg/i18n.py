@@ -29,16 +29,23 @@ from __future__ import print_function
 import lcg
 
 import datetime
+import gettext
+import mmap
 import operator
 import os
 import re
+import struct
 import sys
+import tempfile
+import zlib
 from functools import reduce
 
 unistr = type(u'')  # Python 2/3 transition hack.
 if sys.version_info[0] > 2:
     basestring = str
 
+_PLAIN_TYPES = (unistr, str, bool, int, float)
+
 
 class TranslatableTextFactory(object):
     """A helper for defining the '_' identifier bound to a certain domain.
@@ -210,6 +217,12 @@ class Localizable(unistr):
     def _localize(self, localizer):
         raise Exception("This method must be overriden!")
 
+    def _cache_key(self):
+        # Return a hashable key identifying the localized value of this
+        # instance (for a given localizer) or None if the value can't be
+        # cached.  See 'Localizer.localize()'.
+        return None
+
     def transform(self, function):
         """Return a copy performing given transformation after localization.
 
@@ -412,6 +425,23 @@ class TranslatableText(Localizable):
                     _domain=self._domain, _origin=self._origin, _interpolate=self._interpolate,
                     **self._kwargs)
 
+    def _cache_key(self):
+        # Only instances with plain (string or numeric) arguments are cached.
+        # The equality of 'Localizable' arguments is just the equality of
+        # their string values and the result of interpolation functions or
+        # self translation dictionaries may change any time.
+        args = self._clone_args()
+        kwargs = self._clone_kwargs()
+        transforms = kwargs.pop('_transforms')
+        for value in args + tuple(kwargs.values()):
+            if value is not None and type(value) not in _PLAIN_TYPES:
+                return None
+        # Values of different types may be equal (1 == True == 1.0), so the
+        # types are a part of the key too.
+        return (self.__class__, tuple((type(v), v) for v in args),
+                tuple(sorted((k, type(v), v) for k, v in kwargs.items())), transforms,
+                self._context, self._escape_html)
+
     def domain(self):
         """Return the domain name bound to this instance."""
         return self._domain
@@ -824,11 +854,14 @@ class Concatenation(Localizable):
 
         def x(item):
             if isinstance(item, (list, tuple)):
+                item = [x(i) for i in item]
                 try:
                     return separator.join(item)
                 except UnicodeDecodeError:
                     # Necessary to display some tracebacks
                     return separator.join([escape(i) for i in item])
+            elif isinstance(item, Rope):
+                return unistr(item)
             else:
                 return item
         try:
@@ -867,49 +900,12 @@ class Concatenation(Localizable):
         """
         super(Concatenation, self).__init__(**kwargs)
 
-        def html_escaped(items):
-            if isinstance(items, (list, tuple)):
-                for i in items:
-                    if html_escaped(i):
-                        return True
-            elif isinstance(items, Concatenation):
-                return items._html_escape
-            else:
-                return isinstance(items, lcg.HtmlEscapedUnicode)
-        h_escape = self._html_escape = html_escaped(items)
-        if h_escape:
-            separator = lcg.HtmlEscapedUnicode(separator, escape=True)
-        self._items = flat = []
-        last = []
-
-        def flatten(sequence, separator=separator):
-            for x in sequence:
-                if isinstance(x, Concatenation) and not x._transforms:
-                    s = lcg.HtmlEscapedUnicode('', escape=False) if h_escape else ''
-                    flatten(list(x.items()), separator=s)
-                    last.append(separator)
-                elif isinstance(x, Localizable):
-                    text = ''.join(last)
-                    if text:
-                        if h_escape:
-                            text = lcg.HtmlEscapedUnicode(text, escape=False)
-                        flat.append(text)
-                    del last[:]
-                    flat.append(x)
-                    last.append(separator)
-                elif isinstance(x, (tuple, list)):
-                    flatten(x)
-                else:
-                    assert isinstance(x, basestring)
-                    if h_escape:
-                        x = lcg.HtmlEscapedUnicode(x, escape=True)
-                    last.append(x)
-                    last.append(separator)
-        flatten(items)
-        if len(last) > 1:
-            text = reduce(operator.add, last[1:-1], last[0])
-            if text:
-                flat.append(text)
+        # The items are only flattened on demand (see '_flatten()'), so that
+        # a deeply nested concatenation is flattened just once by its outermost
+        # instance (typically on localization), not at each nesting level.
+        self._parts, length, self._html_escape, self._localizable = _scan(items)
+        self._separator = separator
+        self._items = None
 
     def __setstate__(self, state):
         # Prevent traceback on unpickling an instance which was pickled
@@ -918,14 +914,59 @@ class Concatenation(Localizable):
         self.__dict__ = state
         if '_html_escape' not in state:
             self._html_escape = False
+        if '_parts' not in state:
+            self._parts = self._items
+            self._separator = ''
+            self._localizable = True
+
+    def _leaves(self):
+        # Generate the items of this concatenation including the separators.
+        return _leaves(self._parts, self._separator)
+
+    def _flatten(self):
+        # Return the list of items as described in 'items()'.
+        h_escape = self._html_escape
+        flat = []
+        texts = []
+
+        def text(x):
+            if h_escape:
+                x = lcg.HtmlEscapedUnicode(x, escape=True)
+            texts.append(x)
+
+        def flush():
+            joined = ''.join(texts)
+            if joined:
+                if h_escape:
+                    joined = lcg.HtmlEscapedUnicode(joined, escape=False)
+                flat.append(joined)
+            del texts[:]
+        for x in self._leaves():
+            if isinstance(x, Localizable):
+                flush()
+                flat.append(x)
+            else:
+                assert isinstance(x, basestring), x
+                text(x)
+        flush()
+        return flat
+
+    def _localized_pieces(self, localizer):
+        # Generate the pieces of the localized string in their order.  The
+        # result of 'localize()' is the concatenation of the pieces, but the
+        # pieces are produced one by one without building the list of
+        # 'items()' or the whole output string.
+        if self._transforms:
+            return iter((self.localize(localizer),))
+        return _localized_pieces(self._leaves(), self._html_escape, localizer)
 
     def _clone_args(self):
-        return (self._items,)
+        return (self.items(),)
 
     def _localize(self, localizer):
         h_escape = self._html_escape
         items = []
-        for i in self._items:
+        for i in self.items():
             localized = localizer.localize(i)
             if isinstance(i, lcg.HtmlEscapedUnicode):
                 localized = lcg.HtmlEscapedUnicode(localized, escape=(i != localized))
@@ -945,11 +986,13 @@ class Concatenation(Localizable):
 
     def startswith(self, *args, **kwargs):
         """Return the result of 'startswidth()' call the method on the first item."""
-        return self._items and self._items[0].startswith(*args, **kwargs)
+        items = self.items()
+        return items and items[0].startswith(*args, **kwargs)
 
     def endswith(self, *args, **kwargs):
         """Return the result of 'endwidth()' call the method on the last item."""
-        return self._items and self._items[-1].endswith(*args, **kwargs)
+        items = self.items()
+        return items and items[-1].endswith(*args, **kwargs)
 
     def items(self):
         """Return the list of items included in this concatenation.
@@ -963,9 +1006,167 @@ class Concatenation(Localizable):
         strings or other 'Localizable' instances.
 
         """
+        if self._items is None:
+            self._items = self._flatten()
         return self._items
 
 
+def _scan(items):
+    # Return the tuple (PARTS, LENGTH, HTML_ESCAPED, LOCALIZABLE) for given
+    # 'Concatenation' or 'Rope' items, where PARTS is a copy of 'items' with
+    # sequences as tuples and LENGTH is the total length of the items (not
+    # counting any separators).
+    parts = []
+    length = 0
+    html_escaped = localizable = False
+    for x in items:
+        if isinstance(x, (list, tuple)):
+            x, n, h, loc = _scan(x)
+        elif isinstance(x, Rope):
+            n, h, loc = x._length, x._html_escape, x._localizable
+        elif isinstance(x, Concatenation):
+            n, h, loc = len(x), x._html_escape, x._localizable or bool(x._transforms)
+        elif isinstance(x, Localizable):
+            n, h, loc = len(x), False, True
+        else:
+            n, h, loc = len(x), isinstance(x, lcg.HtmlEscapedUnicode), False
+        parts.append(x)
+        length += n
+        html_escaped = html_escaped or h
+        localizable = localizable or loc
+    return tuple(parts), length, html_escaped, localizable
+
+
+def _leaves(parts, separator):
+    # Generate the items of a concatenation of 'parts' including the separators.
+    # Nested concatenations (without transforms) and ropes are traversed
+    # iteratively through their original parts, so the cost is linear in the
+    # total number of parts regardless of the nesting depth.
+    #
+    # Each stack item is (ITERATOR, LEVEL), where LEVEL is the pair
+    # [SEPARATOR, STARTED] shared by a concatenation and its sequences.
+    stack = [(iter(parts), [separator, False])]
+    while stack:
+        iterator, level = stack[-1]
+        for x in iterator:
+            if isinstance(x, (tuple, list)):
+                stack.append((iter(x), level))
+                break
+            if level[1] and level[0]:
+                yield level[0]
+            level[1] = True
+            if isinstance(x, Rope):
+                stack.append((iter(x._items), ['', False]))
+                break
+            if isinstance(x, Concatenation) and not x._transforms:
+                stack.append((iter(x._parts), [x._separator, False]))
+                break
+            yield x
+        else:
+            stack.pop()
+
+
+def _localized_pieces(leaves, h_escape, localizer):
+    # Generate the localized pieces of given leaves (see '_leaves()').
+    for x in leaves:
+        if isinstance(x, Localizable):
+            x = localizer.localize(x)
+        if h_escape and not isinstance(x, lcg.HtmlEscapedUnicode):
+            x = lcg.HtmlEscapedUnicode(x, escape=True)
+        yield x
+
+
+class Rope(object):
+    """A concatenation of strings which is not joined until needed.
+
+    Unlike 'Concatenation', which builds its string value already in the
+    constructor, a rope only keeps references to its items.  When ropes are
+    nested, the final string is thus built just once (when the outermost rope
+    is converted to a string, localized or written out through
+    'Localizer.localize_chunks()'), not at each nesting level.  The HTML
+    exporter uses ropes for large parts of its output (see
+    'HtmlGenerator.__init__()').
+
+    A rope is not a string, but it supports the most common string operations
+    (they are performed on 'concat()' of the rope).  'lcg.concat()' returns a
+    rope when any of its arguments is a rope.  The items may be strings,
+    'Localizable' instances, other ropes or sequences of them (which are
+    unpacked).
+
+    """
+    __slots__ = ('_items', '_length', '_html_escape', '_localizable')
+
+    def __init__(self, items):
+        self._items, self._length, self._html_escape, self._localizable = _scan(items)
+
+    def __str__(self):
+        return ''.join(_leaves(self._items, ''))
+
+    if sys.version_info[0] == 2:
+        __unicode__ = __str__
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, unistr(self))
+
+    def __len__(self):
+        return self._length
+
+    def __eq__(self, other):
+        if isinstance(other, (Rope, basestring)):
+            return unistr(self) == unistr(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(unistr(self))
+
+    def __add__(self, other):
+        if not isinstance(other, (Rope, basestring)):
+            return NotImplemented
+        return Rope((self, other))
+
+    def __radd__(self, other):
+        if not isinstance(other, (Rope, basestring)):
+            return NotImplemented
+        return Rope((other, self))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.concat(), name)
+
+    def _localized_pieces(self, localizer):
+        # Generate the pieces of the localized string (see
+        # 'Concatenation._localized_pieces()').
+        return _localized_pieces(_leaves(self._items, ''), self._html_escape, localizer)
+
+    def _join(self, pieces):
+        result = ''.join(pieces)
+        if self._html_escape:
+            result = lcg.HtmlEscapedUnicode(result, escape=False)
+        return result
+
+    def concat(self):
+        """Return the rope joined into a 'Concatenation' or a string.
+
+        The result is the same as 'lcg.concat()' would return for the items
+        of the rope (and all the nested ropes) if they were not ropes.
+
+        """
+        leaves = _leaves(self._items, '')
+        if self._localizable:
+            return Concatenation(list(leaves))
+        else:
+            return self._join(_localized_pieces(leaves, self._html_escape, None))
+
+    def localize(self, localizer):
+        """Return the localized string as 'Concatenation.localize()' does."""
+        return self._join(self._localized_pieces(localizer))
+
+
 class Translator(object):
     """A generic translator of translatable objects.
 
@@ -1008,6 +1209,16 @@ class Translator(object):
         """
         pass
 
+    def messages(self, domain=None, origin=None):
+        """Return the sequence of translatable messages of given domain.
+
+        Only messages with a singular form are returned.  Messages with a
+        context are returned as 'context + "\x04" + text' (as in gettext
+        catalogs).  The base class returns an empty sequence.
+
+        """
+        return ()
+
 
 class NullTranslator(Translator):
     """A translator which just returns identical strings as translations."""
@@ -1019,10 +1230,179 @@ class NullTranslator(Translator):
         return n == 1 and singular or plural
 
 
+class MappedTranslations(object):
+    """Gettext translations looked up directly in a memory mapped catalog file.
+
+    The catalog file is a hash table of messages created by 'compile()' from a
+    gettext MO file.  The file is mapped read-only, so when many processes use
+    the same catalog, the operating system shares one copy of it among them
+    instead of each process holding its own dictionary of all messages.
+
+    The instances provide the 'gettext()', 'ngettext()', 'pgettext()' and
+    'npgettext()' methods of 'gettext.NullTranslations', so they may be used
+    in its place.  Looking up a message in the file takes about a
+    microsecond, so the translations found are also kept in a dictionary of
+    the instance.  Repeated lookups then take as long as with
+    'gettext.GNUTranslations' and only the messages actually used take
+    private memory.
+
+    File layout (all numbers are unsigned 32-bit little endian integers):
+
+      header -- magic string, number of buckets, number of messages and the
+        offset and length of the 'Plural-Forms' expression.
+      buckets -- pairs (HASH, OFFSET) of message entries addressed by the
+        key's CRC-32 with linear probing.  Zero offset marks an empty bucket.
+      entries -- KEY_LENGTH, VALUE_LENGTH, KEY and VALUE as UTF-8 bytes.  The
+        key is the message id (with context as 'context + "\x04" + msgid').
+        Translations of plural forms are separated by a zero byte.
+
+    """
+    _MAGIC = b'LCGCAT01'
+    _HEADER = struct.Struct('<8sIIII')  # 24 bytes
+    _PAIR = struct.Struct('<II')  # 8 bytes
+
+    @classmethod
+    def compile(cls, translations, filename):
+        """Write the catalog file for given 'gettext.GNUTranslations' instance.
+
+        The file is written under a temporary name and renamed at the end, so
+        processes compiling the same catalog concurrently never see an
+        incomplete file.
+
+        """
+        catalog = {}
+        for key, value in translations._catalog.items():
+            if isinstance(key, tuple):
+                msgid, n = key
+                forms = catalog.setdefault(msgid, [])
+                forms.extend([''] * (n + 1 - len(forms)))
+                forms[n] = value
+            else:
+                catalog[key] = value
+        entries = [(key.encode('utf-8'),
+                    ('\0'.join(value) if isinstance(value, list) else value).encode('utf-8'))
+                   for key, value in catalog.items()]
+        plural = translations.info().get('plural-forms', '').encode('utf-8')
+        size = 1
+        while size < 2 * len(entries):
+            size *= 2
+        buckets = [(0, 0)] * size
+        offset = cls._HEADER.size + size * cls._PAIR.size
+        data = []
+        for key, value in entries:
+            h = zlib.crc32(key) & 0xffffffff
+            i = h & (size - 1)
+            while buckets[i][1]:
+                i = (i + 1) & (size - 1)
+            buckets[i] = (h, offset)
+            data.extend((cls._PAIR.pack(len(key), len(value)), key, value))
+            offset += cls._PAIR.size + len(key) + len(value)
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory or None, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(cls._HEADER.pack(cls._MAGIC, size, len(entries), offset, len(plural)))
+                f.write(b''.join([cls._PAIR.pack(*b) for b in buckets]))
+                f.write(b''.join(data))
+                f.write(plural)
+            os.rename(tmp, filename)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def __init__(self, filename):
+        """Map the catalog file 'filename' created by 'compile()'."""
+        with open(filename, 'rb') as f:
+            self._data = data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, self._count, offset, length = self._HEADER.unpack_from(data, 0)
+        if magic != self._MAGIC:
+            raise IOError("Invalid catalog file: %s" % filename)
+        self._mask = size - 1
+        self._cache = {}
+        self._info = {}
+        self._plural = lambda n: int(n != 1)
+        plural = data[offset:offset + length].decode('utf-8')
+        if plural:
+            self._info['plural-forms'] = plural
+            self._plural = gettext.c2py(plural.split(';')[1].split('plural=')[1])
+
+    def _lookup(self, key):
+        # Return the translation of 'key' as a unicode string or None.
+        translation = self._cache.get(key)
+        if translation is not None:
+            return translation
+        encoded = key.encode('utf-8')
+        h = zlib.crc32(encoded) & 0xffffffff
+        data = self._data
+        unpack = self._PAIR.unpack_from
+        mask = self._mask
+        i = h & mask
+        while True:
+            bucket_hash, offset = unpack(data, 24 + i * 8)
+            if not offset:
+                return None
+            if bucket_hash == h:
+                key_length, value_length = unpack(data, offset)
+                start = offset + 8
+                end = start + key_length
+                if data[start:end] == encoded:
+                    translation = data[end:end + value_length].decode('utf-8')
+                    self._cache[key] = translation
+                    return translation
+            i = (i + 1) & mask
+
+    def info(self):
+        return self._info
+
+    def _plural_form(self, key, msgid1, msgid2, n):
+        translation = self._lookup(key)
+        if translation is not None:
+            forms = translation.split('\0')
+            index = self._plural(n)
+            if index < len(forms):
+                return forms[index]
+        return msgid1 if n == 1 else msgid2
+
+    def gettext(self, message):
+        translation = self._cache.get(message)
+        if translation is None:
+            translation = self._lookup(message)
+            if translation is None:
+                return message
+        return translation
+
+    def ngettext(self, msgid1, msgid2, n):
+        return self._plural_form(msgid1, msgid1, msgid2, n)
+
+    def pgettext(self, context, message):
+        translation = self._lookup(context + '\x04' + message)
+        return message if translation is None else translation
+
+    def npgettext(self, context, msgid1, msgid2, n):
+        return self._plural_form(context + '\x04' + msgid1, msgid1, msgid2, n)
+
+    ugettext = gettext
+    ungettext = ngettext
+
+    def messages(self):
+        """Return the list of all message ids present in the catalog."""
+        data = self._data
+        result = []
+        for i in range(self._mask + 1):
+            offset = self._PAIR.unpack_from(data, 24 + i * 8)[1]
+            if offset:
+                key_length = self._PAIR.unpack_from(data, offset)[0]
+                result.append(data[offset + 8:offset + 8 + key_length].decode('utf-8'))
+        return result
+
+
 class GettextTranslator(Translator):
     """Translator based on the GNU gettext interface."""
 
-    def __init__(self, lang, path=(), default_domain='lcg', fallback=False, **kwargs):
+    def __init__(self, lang, path=(), default_domain='lcg', fallback=False, catalog_dir=None,
+                 **kwargs):
         """Initialize the instance.
 
         Arguments:
@@ -1040,6 +1420,13 @@ class GettextTranslator(Translator):
           fallback -- if true, the translator will silently use a null translation in case the
             desired translation files are not found.
 
+          catalog_dir -- directory for compiled catalog files or None.  If
+            given, the MO files are not loaded into memory, but compiled into
+            this directory and looked up through 'MappedTranslations'.  The
+            compiled files are shared by all processes using the same
+            directory (they are only recompiled when the MO file changes), so
+            this is useful in multi-process servers.
+
         """
         assert isinstance(lang, basestring), lang
         assert isinstance(path, (list, tuple)), path
@@ -1048,12 +1435,28 @@ class GettextTranslator(Translator):
         self._default_domain = default_domain
         self._fallback = fallback
         self._path = tuple(path)
+        self._catalog_dir = catalog_dir
         self._cache = {}
         super(GettextTranslator, self).__init__(lang, **kwargs)
 
+    def _mapped_translations(self, domain, filename):
+        st = os.stat(filename)
+        key = '%s:%s:%s' % (os.path.abspath(filename), st.st_mtime, st.st_size)
+        catalog = os.path.join(self._catalog_dir, '%s.%s.%08x.catalog' % (
+            domain, self._lang, zlib.crc32(key.encode('utf-8')) & 0xffffffff,
+        ))
+        if not os.path.exists(catalog):
+            with open(filename, 'rb') as f:
+                MappedTranslations.compile(gettext.GNUTranslations(f), catalog)
+        return MappedTranslations(catalog)
+
     def _gettext_instance(self, domain, origin):
-        import gettext
         for dir in self._path:
+            if self._catalog_dir is not None:
+                filename = gettext.find(domain, dir, (self._lang,))
+                if filename:
+                    return self._mapped_translations(domain, filename)
+                continue
             try:
                 return gettext.translation(domain, dir, (self._lang,))
             except IOError:
@@ -1091,6 +1494,17 @@ class GettextTranslator(Translator):
         result = gettext.ngettext(singular, plural, n)
         return result
 
+    def messages(self, domain=None, origin=None):
+        domain = domain or self._default_domain
+        gettext = self._cached_gettext_instance(domain, origin)
+        if isinstance(gettext, MappedTranslations):
+            catalog = gettext.messages()
+        else:
+            # The catalog is not a public attribute, but it is present in all
+            # Python versions (it is missing in NullTranslations).
+            catalog = getattr(gettext, '_catalog', {})
+        return [msgid for msgid in catalog if isinstance(msgid, basestring) and msgid]
+
 
 class Localizer(object):
     """Localizer of localizable objects.
@@ -1106,15 +1520,16 @@ class Localizer(object):
     _locale_data_cache = {}
 
     @classmethod
-    def _get_translator(cls, lang, translation_path):
-        key = (lang, tuple(translation_path))
+    def _get_translator(cls, lang, translation_path, catalog_dir=None):
+        key = (lang, tuple(translation_path), catalog_dir)
         try:
             translator = cls._translator_cache[key]
         except KeyError:
             if lang is None:
                 translator = NullTranslator()
             else:
-                translator = GettextTranslator(lang, path=translation_path, fallback=True)
+                translator = GettextTranslator(lang, path=translation_path, fallback=True,
+                                               catalog_dir=catalog_dir)
             cls._translator_cache[key] = translator
         return translator
 
@@ -1130,13 +1545,35 @@ class Localizer(object):
             cls._locale_data_cache[lang] = locale_data = locale_data_class()
         return locale_data
 
-    def __init__(self, lang=None, translation_path=(), timezone=None):
+    def __init__(self, lang=None, translation_path=(), timezone=None, cache_size=1000,
+                 catalog_dir=None):
+        """Initialize the instance.
+
+        Arguments:
+
+          lang -- target language code as a string or None.
+          translation_path -- a sequence of directory names to search for
+            translations (see 'GettextTranslator').
+          timezone -- target time zone as 'datetime.tzinfo' or None.
+          cache_size -- maximal number of localized values remembered by the
+            instance.  The localized values of 'TranslatableText' instances
+            with plain string or numeric arguments are cached, so that the
+            texts repeating on many pages (such as navigation labels) are only
+            translated and interpolated once.  The cache is emptied when it
+            reaches given size.  Zero disables caching.
+          catalog_dir -- directory for compiled translation catalogs shared
+            by multiple processes or None (see 'GettextTranslator').
+
+        """
         assert lang is None or isinstance(lang, basestring)
         assert timezone is None or isinstance(timezone, datetime.tzinfo)
+        assert isinstance(cache_size, int) and cache_size >= 0, cache_size
         self._lang = lang
         self._timezone = timezone
-        self._translator = self._get_translator(lang, translation_path)
+        self._translator = self._get_translator(lang, translation_path, catalog_dir)
         self._locale_data = self._get_locale_data(lang)
+        self._cache = {}
+        self._cache_size = cache_size
 
     def lang(self):
         """Return the target language of this localizer."""
@@ -1157,18 +1594,101 @@ class Localizer(object):
     def localize(self, text):
         """Return the localized string for given localizable or string instance.
 
-        The argument may be a 'Localizable' instance or a plain or unicode
-        string instance.
+        The argument may be a 'Localizable' instance, a 'Rope' or a plain or
+        unicode string instance.
 
         Returns a string or unicode depending if there was a unicode type
         within the input (as well as 'Concatenation.localize()'.
 
         """
         if isinstance(text, Localizable):
+            if self._cache_size:
+                key = text._cache_key()
+                if key is not None:
+                    cache = self._cache
+                    try:
+                        return cache[key]
+                    except KeyError:
+                        if len(cache) >= self._cache_size:
+                            cache.clear()
+                        result = cache[key] = text.localize(self)
+                        return result
+            return text.localize(self)
+        elif isinstance(text, Rope):
             return text.localize(self)
         else:
             return text
 
+    def prewarm(self, domains, origin='en'):
+        """Fill the localization cache with all messages of given translation domains.
+
+        Arguments:
+
+          domains -- sequence of gettext domain names.
+          origin -- the language of the original texts in these domains.
+
+        All messages of the domains' translation catalogs for this localizer's
+        language are localized and cached (until the cache is full), so that
+        the first localization of each of these texts (without interpolation
+        arguments) is served from the cache.  Loading the catalogs in advance
+        also avoids loading them in the middle of export.
+
+        """
+        for domain in domains:
+            for msgid in self._translator.messages(domain, origin):
+                if len(self._cache) >= self._cache_size:
+                    return
+                if '\x04' in msgid:
+                    context, msgid = msgid.split('\x04', 1)
+                else:
+                    context = None
+                self.localize(TranslatableText(msgid, _domain=domain, _origin=origin,
+                                               _context=context))
+
+    def localize_chunks(self, text, chunk_size=65536):
+        """Generate the localized string for given text in consecutive chunks.
+
+        Arguments:
+
+          text -- 'Localizable' instance, 'Rope' or a plain or unicode string
+            (as for 'localize()').
+          chunk_size -- approximate length of the generated chunks.
+
+        The concatenation of the generated strings is equal to the result of
+        'localize()'.  'Concatenation' and 'Rope' instances are localized item
+        by item and long strings are split, so the whole localized string is never
+        held in memory.  This allows writing large documents into files (or
+        other streams) gradually.
+
+        """
+        if not isinstance(text, (Concatenation, Rope)):
+            # Also handles binary strings (such as PDF output).
+            text = self.localize(text)
+            for i in range(0, len(text), chunk_size):
+                yield text[i:i + chunk_size]
+            return
+        pieces = text._localized_pieces(self)
+        chunk = []
+        length = 0
+        for piece in pieces:
+            if len(piece) > chunk_size:
+                # Large strings (such as already localized output) are split.
+                if chunk:
+                    yield ''.join(chunk)
+                    chunk = []
+                    length = 0
+                for i in range(0, len(piece), chunk_size):
+                    yield piece[i:i + chunk_size]
+                continue
+            chunk.append(piece)
+            length += len(piece)
+            if length >= chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                length = 0
+        if chunk:
+            yield ''.join(chunk)
+
     translate = localize
     """Deprecated backwards compatibility alias - please use 'localize' instead."""
 
@@ -1180,10 +1700,12 @@ def concat(*args, **kwargs):
     its constructor, but the items can be passed as positional arguments for
     convenience.  Keyword arguments are passed on without change.
 
-    One special case is handled differently.  When the whole concatenation is an
-    ordinary Python string or unicode type (there were no 'Localizable'
+    Two special cases are handled differently.  When the whole concatenation is
+    an ordinary Python string or unicode type (there were no 'Localizable'
     instances within the input), this string is returned directly (without the
-    surrounding 'Concatenation' instance).
+    surrounding 'Concatenation' instance).  When any of the arguments is a
+    'Rope' (and there are no keyword arguments), a 'Rope' of the arguments is
+    returned, so that the ropes are not joined prematurely.
 
     See 'Concatenation' constructor for more information about the arguments.
 
@@ -1195,17 +1717,29 @@ def concat(*args, **kwargs):
             args = args[0]
         for a in args:
             if not isinstance(a, basestring) or isinstance(a, Localizable):
+                if any(isinstance(a, Rope) for a in args):
+                    return Rope(args)
                 break
         else:
             if len(args) == 0:
                 return u''
+            first = args[0]
+            if isinstance(first, lcg.HtmlEscapedUnicode):
+                # Join at once rather than adding the items one by one, which
+                # would copy the growing result for each item.  The result is
+                # the same as 'HtmlEscapedUnicode.__add__()' would produce.
+                return first.__class__(''.join(args), escape=False)
+            elif isinstance(first, unistr):
+                return ''.join(args)
             else:
-                return reduce(operator.add, args[1:], args[0])
+                return reduce(operator.add, args[1:], first)
     # Standard processing
     result = Concatenation(args, **kwargs)
-    items = list(result.items())
-    if len(items) == 1 and not isinstance(items[0], Localizable):
-        return items[0]
+    if not result._localizable:
+        # Only flatten the items here if the result is a plain string.
+        items = result.items()
+        if len(items) == 1:
+            return items[0]
     return result
 
 
@@ -50,6 +50,17 @@ OPTIONS = (
           "message catalogs in their usual structure (with subdirectories for "
           "each of the supported locales, such as 'de/LC_MESSAGES/domain.mo').")),
         ('presentation=', None, ("Presentation file.")),
+        ('cache-dir=', None,
+         ("Directory where the results of parsing the source files are cached.  Unchanged "
+          "source files are then loaded from the cache instead of parsing them again.")),
+        ('jobs=', None,
+         ("Number of processes used to read and parse the source files in parallel.  "
+          "The same number of processes is used to export the output in HTML, PDF, plain "
+          "text and Braille formats.")),
+        ('lazy', False,
+         ("Read the language variants of source documents only when they are exported.  "
+          "Useful together with --lang to avoid reading the other languages.  The source "
+          "files are read serially in this mode (--jobs only applies to the export).")),
     )),
     ("Output format selection", (
         ('html', False, "generate static HTML files (default)."),
@@ -62,12 +73,19 @@ OPTIONS = (
     )),
     ("Output options", (
         ('lang=', None,
-         ("Language variant to generate (all variants are generated by default).")),
+         ("Language variant to generate (all variants are generated by default).  All "
+          "language variants are still read unless --lazy is used.")),
         ('sec-lang=', None,
          ("Secondary content language to use for citations.")),
         ('force-lang-ext', False,
          ("If set, all generated files will have a language extension.  By default, "
           "the extension is only added if there is more than one output language.")),
+        ('skip-unchanged', False,
+         ("Don't rewrite existing output files if their content didn't change (their "
+          "modification time is preserved).  Not supported for EPUB output.")),
+        ('changed-files=', None,
+         ("Write the list of created or changed output files (relative to the destination "
+          "directory, one per line) into given file.  Not supported for EPUB output.")),
     )),
     ("HTML output specific options", (
         ('styles=', 'default.css',
@@ -105,6 +123,10 @@ def main(argv, opt, args):
         output_format = formats[0]
     else:
         die("Can't use %s together!" % ' and '.join(['--' + f for f in formats]))
+    if output_format == EPUB:
+        for option in ('skip-unchanged', 'changed-files'):
+            if opt[option]:
+                die("Can't use --%s with --epub!" % option)
     # Find out whether the input is a single file or a directory.
     if len(args) == 1:
         src, dst = args[0], None
@@ -145,17 +167,27 @@ def main(argv, opt, args):
     kwargs = {}
     if opt['plain']:
         kwargs['cls'] = lcg.DocFileReader
+    if opt['lazy']:
+        # Only read the language variants which are actually exported.
+        kwargs['lazy'] = True
+    if opt['cache-dir']:
+        kwargs['cache_dir'] = opt['cache-dir']
+    if opt['jobs']:
+        try:
+            jobs = int(opt['jobs'])
+        except ValueError:
+            jobs = 0
+        if jobs < 1:
+            die("Invalid number of jobs: %s" % opt['jobs'])
+        kwargs['jobs'] = jobs
+    else:
+        jobs = None
 
     reader = lcg.reader(src, name, ext=ext, recourse=recourse, encoding=opt['encoding'], **kwargs)
     try:
         node = reader.build()
     except IOError as e:
-        message = unistr(e)
-        match = re.match('[[]Errno[^]]*[]] *', message)
-        if match:
-            message = message[match.end():]
-        sys.stderr.write(message)
-        sys.stderr.write('\n')
+        report_read_error(e)
         return
     # Decide which exporter to use.
     kwargs = {}
@@ -179,7 +211,11 @@ def main(argv, opt, args):
         else:
             cls = lcg.HtmlStaticExporter
         kwargs = dict(styles=opt['styles'].split(':'), inlinestyles=opt['inline-styles'])
+    if jobs and output_format in (HTML, PDF, TEXT, BRAILLE):
+        export_kwargs['jobs'] = jobs
     kwargs['force_lang_ext'] = opt['force-lang-ext']
+    if output_format != EPUB:
+        kwargs['skip_unchanged'] = opt['skip-unchanged']
     # Create the exporter instance.
     exporter = cls(translations=translations, **kwargs)
     # Write the exported content to output file(s).
@@ -202,8 +238,26 @@ def main(argv, opt, args):
         presentation = read_presentation(presentation_option)
     else:
         presentation = read_style(presentation_option)
-    exporter.dump(node, dst, filename=filename, variant=lang, sec_lang=opt['sec-lang'],
-                  presentation=presentation, **export_kwargs)
+    try:
+        exporter.dump(node, dst, filename=filename, variant=lang, sec_lang=opt['sec-lang'],
+                      presentation=presentation, **export_kwargs)
+    except lcg.VariantReadError as e:
+        # The source files are read during the export in lazy mode.
+        report_read_error(e)
+        return
+    if opt['changed-files']:
+        with open(opt['changed-files'], 'w') as f:
+            for path in exporter.changed_files():
+                f.write(os.path.relpath(path, dst) + '\n')
+
+
+def report_read_error(exception):
+    message = unistr(exception)
+    match = re.match('[[]Errno[^]]*[]] *', message)
+    if match:
+        message = message[match.end():]
+    sys.stderr.write(message)
+    sys.stderr.write('\n')
 
 
 def read_presentation(filename):
@@ -30,7 +30,6 @@ from __future__ import unicode_literals
 
 import sys
 import lcg
-import functools
 import copy
 
 from lcg import is_sequence_of
@@ -125,6 +124,7 @@ class ContentNode(object):
         assert heading is None or isinstance(heading, lcg.Content), heading
         self._id = id
         self._parent = None  # parent
+        self._tree_index = None
         self._title = title if title is not None else brief_title or id
         self._heading = heading or lcg.TextContent(self._title)
         self._brief_title = brief_title or title
@@ -146,8 +146,7 @@ class ContentNode(object):
         self._default_variant = Variant('--', **kwargs)
         self._cover_image = cover_image
         for variant in tuple(variants) + (self._default_variant,):
-            if variant.content():
-                variant.content().set_parent(self)
+            variant._set_node(self)
         self._empty_content = lcg.Content()
         # if __debug__:
         #    seen = {}
@@ -165,6 +164,33 @@ class ContentNode(object):
         assert isinstance(node, ContentNode)
         assert self._parent is None
         self._parent = node
+        # The subtree is now a part of a bigger tree indexed by its root.
+        self._tree_index = None
+
+    def _index(self):
+        # Return the index of the whole tree as a triple (LINEAR, POSITIONS, IDS).
+        # LINEAR is the list of all nodes in preorder, POSITIONS is a dictionary
+        # of pairs (START, END) keyed by nodes, where START is the node's position
+        # in LINEAR and END is the position following the node's subtree and IDS
+        # is a dictionary of position lists keyed by node ids.  The index is built
+        # on first use and kept by the root node.
+        root = self.root()
+        index = root._tree_index
+        if index is None:
+            linear = []
+            positions = {}
+            ids = {}
+
+            def add(node):
+                start = len(linear)
+                linear.append(node)
+                ids.setdefault(node.id(), []).append(start)
+                for child in node.children():
+                    add(child)
+                positions[node] = (start, len(linear))
+            add(root)
+            index = root._tree_index = (linear, positions, ids)
+        return index
 
     # Public methods
 
@@ -221,15 +247,13 @@ class ContentNode(object):
         return find(section_id, self.content(lang).sections())
 
     def find_node(self, id):
-        def find(id, node):
-            if node.id() == id:
-                return node
-            for n in node.children():
-                found = find(id, n)
-                if found:
-                    return found
-            return None
-        return find(id, self)
+        """Return the node of given 'id' within this node's subtree or None."""
+        linear, positions, ids = self._index()
+        start, end = positions[self]
+        for position in ids.get(id, ()):
+            if start <= position < end:
+                return linear[position]
+        return None
 
     def root(self):
         """Return the top-most node of the hierarchy."""
@@ -252,12 +276,19 @@ class ContentNode(object):
 
     def linear(self):
         """Return the linearized subtree of this node as a list."""
-        return [self] + functools.reduce(lambda l, n: l + n.linear(), self.children(), [])
+        linear, positions, ids = self._index()
+        start, end = positions[self]
+        return linear[start:end]
+
+    def position(self):
+        """Return the position of this node in the linearized structure of the whole tree."""
+        linear, positions, ids = self._index()
+        return positions[self][0]
 
     def next(self):
         """Return the node following this node in the linearized structure."""
-        linear = self.root().linear()
-        i = linear.index(self)
+        linear, positions, ids = self._index()
+        i = positions[self][0]
         if i < len(linear) - 1:
             return linear[i + 1]
         else:
@@ -265,8 +296,8 @@ class ContentNode(object):
 
     def prev(self):
         """Return the node preceding this node in the linearized structure."""
-        linear = self.root().linear()
-        i = linear.index(self)
+        linear, positions, ids = self._index()
+        i = positions[self][0]
         if i > 0:
             return linear[i - 1]
         else:
@@ -333,6 +364,10 @@ class ContentNode(object):
     def resource(self, filename, **kwargs):
         """Get the resource instance by its type and relative filename."""
         for lang in self.variants() or (None,):
+            variant = self._variants_dict.get(lang)
+            if variant is not None and not variant.loaded():
+                # Don't read a lazy variant just to look for its resources.
+                continue
             for resource in self.content(lang).resources():
                 if resource.filename() == filename:
                     # Hmm, why don't have images here src_file set?
@@ -511,31 +546,116 @@ class Variant(object):
         self._page_background = _content(page_background)
         self._presentation = presentation
 
+    def _set_node(self, node):
+        # Called by the 'ContentNode' constructor to connect the content to its node.
+        if self._content:
+            self._content.set_parent(node)
+
     def lang(self):
         return self._lang
 
+    def loaded(self):
+        """Return True if the variant attributes are available without reading them."""
+        return True
+
+    def content(self):
+        return self._content
+
+    def page_header(self):
+        return self._page_header
+
+    def first_page_header(self):
+        return self._first_page_header
+
+    def page_footer(self):
+        return self._page_footer
+
+    def left_page_footer(self):
+        return self._left_page_footer
+
+    def right_page_footer(self):
+        return self._right_page_footer
+
+    def page_background(self):
+        return self._page_background
+
+    def presentation(self):
+        return self._presentation
+
+
+class LazyVariant(Variant):
+    """Language variant with attributes read on demand.
+
+    The attributes are obtained on first access to any of them (except for
+    'lang()') by calling the function passed to the constructor.  This allows
+    to avoid reading and parsing the sources of language variants which are
+    never used, such as when only one language of a multilingual publication
+    is exported.
+
+    """
+
+    def __init__(self, lang, read):
+        """Arguments:
+
+          lang -- an ISO 639-1 Alpha-2 language code
+          read -- function of no arguments returning a dictionary of the
+            remaining 'Variant' constructor arguments ('content',
+            'page_header', etc.).  It is called once, on first access to any of
+            the variant attributes.
+
+        """
+        assert isinstance(lang, basestring) and len(lang) == 2, lang
+        assert callable(read), read
+        self._lang = lang
+        self._read = read
+        self._node = None
+
+    def _load(self):
+        if self._read is not None:
+            kwargs = self._read()
+            self._read = None
+            super(LazyVariant, self).__init__(self._lang, **kwargs)
+            if self._node is not None:
+                super(LazyVariant, self)._set_node(self._node)
+
+    def _set_node(self, node):
+        self._node = node
+        if self._read is None:
+            super(LazyVariant, self)._set_node(node)
+
+    def loaded(self):
+        return self._read is None
+
     def content(self):
+        self._load()
         return self._content
 
     def page_header(self):
+        self._load()
         return self._page_header
 
     def first_page_header(self):
+        self._load()
         return self._first_page_header
 
     def page_footer(self):
+        self._load()
         return self._page_footer
 
     def left_page_footer(self):
+        self._load()
         return self._left_page_footer
 
     def right_page_footer(self):
+        self._load()
         return self._right_page_footer
 
     def page_background(self):
+        self._load()
         return self._page_background
 
     def presentation(self):
+        self._load()
         return self._presentation
 
 
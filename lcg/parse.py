@@ -25,6 +25,8 @@ from builtins import chr
 from builtins import map
 from builtins import range
 
+import bisect
+import collections
 import copy
 import html.parser
 import html.entities
@@ -59,7 +61,7 @@ class ProcessingError(Exception):
 
         """
         self._reason = reason
-        self._info = info
+        self._info = list(info)
 
     def add_info(self, caption, information):
         """Add more information to the exception.
@@ -116,32 +118,31 @@ class Parser(object):
 
     """
     _ALIGNMENT_MATCHER = re.compile(r'@(center|centre|left|right) *\r?$', re.MULTILINE)
-    _HRULE_MATCHER = re.compile(r'^----+ *\r?$', re.MULTILINE)
+    _HRULE_MATCHER = re.compile(r'----+ *\r?$', re.MULTILINE)
     _TOC_MATCHER = re.compile(r'(?:(?P<title>[^\r\n]+)[\t ]+)?\@(?P<toctype>(N?TOC|NodeIndex))'
                               r'(\((?P<tocdepth>\d+)\))?\@ *')
     _TABLE_MATCHER = re.compile(r'\|.*\| *\r?$', re.MULTILINE)
     _CELL_ALIGNMENT_MATCHER = re.compile(r'<([clr]?)([0-9]*)>')
     _CELL_ALIGNMENT_MAPPING = {'c': lcg.TableCell.CENTER, 'l': lcg.TableCell.LEFT,
                                'r': lcg.TableCell.RIGHT}
-    _COMMENT_MATCHER = re.compile('^#[^\r\n]*\r?(\n|$)', re.MULTILINE)
-    _SECTION_MATCHER = re.compile((r'^(?P<level>=+) (?P<collapsible>>\+? +)?'
+    _SECTION_MATCHER = re.compile((r'(?P<level>=+) (?P<collapsible>>\+? +)?'
                                    r'(?P<title>.*) (?P=level)'
                                    r'(?:[\t ]+(?:\*|(?P<not_in_toc>\!)?'
                                    r'(?P<section_id>[\w\d_-]+)))?'
                                    r'(?P<section_classes>(?:[\t ]+\.[\w\d_-]+)*) *\r?$'),
                                   re.MULTILINE)
-    _CONTAINER_MATCHER = re.compile((r'^(?P<collapsible>\[(?P<title>[^\]]+)\]\+? +)?'
+    _CONTAINER_MATCHER = re.compile((r'(?P<collapsible>\[(?P<title>[^\]]+)\]\+? +)?'
                                      r'\>(?P<level>\>+)'
                                      r'(?P<id>[ \t]+([ \t]*[#\.=]?[\w\d_-]+)*)?'
                                      r'([ \t]+"(?P<label>[^"]*)")?'
                                      r'[\t ]*\r?$'), re.MULTILINE)
     _CONTAINER_END_MATCHER = [re.compile(r'^\<%s *\r?$' % (r'\<' * i), re.MULTILINE)
                               for i in range(10)]
-    _LINE_MATCHER = re.compile(r'^([\t ]*)([^\n\r]*)\r?(\n|$)', re.MULTILINE)
-    _LITERAL_MATCHER = re.compile(r'^-----+[ \t]*\r?\n(.*?)^-----+ *\r?$', re.DOTALL | re.MULTILINE)
-    _DOCTEST_MATCHER = re.compile(r'(^>>> .+\r?\n)(^(>>>|\.\.\.)[ \t].+\r?\n)*(^[ \t]*\S.*\r?\n)*',
+    _LINE_MATCHER = re.compile(r'([\t ]*)([^\n\r]*)\r?(\n|$)', re.MULTILINE)
+    _LITERAL_MATCHER = re.compile(r'-----+[ \t]*\r?\n(.*?)^-----+ *\r?$', re.DOTALL | re.MULTILINE)
+    _DOCTEST_MATCHER = re.compile(r'(>>> .+\r?\n)(^(>>>|\.\.\.)[ \t].+\r?\n)*(^[ \t]*\S.*\r?\n)*',
                                   re.MULTILINE)
-    _EXERCISE_MATCHER = re.compile(r'^<exercise type=["\']([a-zA-Z]+)["\']>\s*\r?\n'
+    _EXERCISE_MATCHER = re.compile(r'<exercise type=["\']([a-zA-Z]+)["\']>\s*\r?\n'
                                    r'(.*?)^</exercise>\s*\r?$',
                                    re.DOTALL | re.MULTILINE)
     _VARIABLE_MATCHER = re.compile(r'@define +([a-z_]+)( +.*)?\r?$', re.MULTILINE)
@@ -153,7 +154,32 @@ class Parser(object):
                                      r'(?P<description>([\t ]+\S+\r?\n)*([\t ]+\S+\r?\n?))')
     _LIST_MATCHER = re.compile(r'( *)\(?(?:\*|-|(?:[a-z]|\d+|#)(?:\)|\.)) +')
     _STYLE_MATCHER = re.compile(r'@style +([a-z_]+)[\t ]*\r?$', re.MULTILINE)
-    _TAB_MATCHER = re.compile(r'^\t')
+    _PREPROCESSING_MATCHER = re.compile('^(?:#[^\r\n]*\r?(?:\n|$)|\t)', re.MULTILINE)
+    _END_MATCHERS = {}
+
+    _PROCESSOR_START_CHARACTERS = {
+        '_alignment_processor': '@',
+        '_field_processor': ':',
+        '_section_processor': '=',
+        '_container_processor': '[>',
+        '_literal_processor': '-',
+        '_doctest_processor': '>',
+        '_exercise_processor': '<',
+        '_hrule_processor': '-',
+        '_table_processor': '|',
+        '_list_processor': ' (*-#' + string.digits + string.ascii_lowercase,
+        '_parameters_processor': '@',
+        '_variable_processor': '@',
+        '_style_processor': '@',
+        '_space_processor': '@',
+    }
+    """Characters which may start a block matched by given processor.
+
+    Dictionary keyed by processor method names.  Blocks are only passed to the
+    processors which may match the first character of the block.  Processors
+    not present in the dictionary are tried for any block.
+
+    """
 
     _PARAMETERS = {'header': ('parameter', 'page_header', None,),
                    'first_page_header': ('parameter', 'first_page_header', None,),
@@ -214,7 +240,59 @@ class Parser(object):
             self.name = name
             self.content = []
 
-    def __init__(self):
+    class _LineMap(object):
+        """Mapping of preprocessed text positions to the original source lines.
+
+        Preprocessing removes comment lines, so the positions in the
+        preprocessed text don't match the source.  The map remembers how the
+        positions were shifted and computes the original line number only when
+        needed (typically when reporting an error).
+
+        """
+
+        def __init__(self, source, positions, shifts, parent=None, offset=0):
+            """Arguments:
+
+              source -- the original text before preprocessing
+              positions -- sorted list of positions in the preprocessed text
+                where the shift against the source changes
+              shifts -- list of the total shifts (the number of characters to
+                add to get the source position) valid from the corresponding
+                item of 'positions' on
+              parent -- '_LineMap' instance of the enclosing text when 'source' is
+                a fragment of another (preprocessed) text or None
+              offset -- position of the fragment within the parent text
+
+            """
+            self._source = source
+            self._positions = positions
+            self._shifts = shifts
+            self._parent = parent
+            self._offset = offset
+
+        def line(self, position):
+            """Return the source line number (counted from 1) of given 'position'."""
+            i = bisect.bisect_right(self._positions, position)
+            if i:
+                position += self._shifts[i - 1]
+            if self._parent is not None:
+                return self._parent.line(self._offset + position)
+            else:
+                return self._source.count('\n', 0, position) + 1
+
+    def __init__(self, statistics=False, inline_cache_size=0):
+        """Arguments:
+
+          statistics -- iff true, count the successful and unsuccessful block
+            processor invocations for profiling purposes.  See 'statistics()'.
+          inline_cache_size -- maximal number of 'parse_inline_markup()'
+            results remembered for reuse (the least recently used results are
+            discarded first).  Repeated parsing of the same short texts (table
+            cells, field values, exercise answers) may be avoided this way.
+            Zero (the default) disables the cache.  See
+            'inline_cache_statistics()'.
+
+        """
         self._processors = (self._alignment_processor,
                             self._field_processor,
                             self._section_processor,
@@ -241,6 +319,16 @@ class Parser(object):
                    for name, markup in self._INLINE_MARKUP]
         self._inline_markup = re.compile('(?:' + '|'.join(regexps) + ')',
                                          re.MULTILINE | re.UNICODE | re.IGNORECASE)
+        self._line_map = None
+        self._located_error = None
+        self._dispatched_processors = None
+        self._dispatch_table = {}
+        self._dispatch_default = ()
+        self._statistics = {} if statistics else None
+        self._inline_cache_size = inline_cache_size
+        self._inline_cache = collections.OrderedDict()
+        self._inline_cache_hits = 0
+        self._inline_cache_misses = 0
 
     def _prune_kwargs(self, kwargs, prune):
         kwargs = copy.copy(kwargs)
@@ -251,8 +339,17 @@ class Parser(object):
                 pass
         return kwargs
 
+    def _end_matcher(self, identifier):
+        # Return the (cached) matcher of the '@end <identifier>' line.
+        try:
+            matcher = self._END_MATCHERS[identifier]
+        except KeyError:
+            matcher = self._END_MATCHERS[identifier] = \
+                re.compile('^@end %s *\r?$' % (identifier,), re.MULTILINE)
+        return matcher
+
     def _alignment_processor(self, text, position, **kwargs):
-        match = self._ALIGNMENT_MATCHER.match(text[position:])
+        match = self._ALIGNMENT_MATCHER.match(text, position)
         if not match:
             return None
         identifier = match.group(1)
@@ -262,7 +359,7 @@ class Parser(object):
             halign = lcg.HorizontalAlignment.LEFT
         elif identifier == 'right':
             halign = lcg.HorizontalAlignment.RIGHT
-        position = self._find_next_block(text, position + match.end())
+        position = self._find_next_block(text, match.end())
         kwargs = self._prune_kwargs(kwargs, ('halign',))
         return self._parse(text, position, halign=halign, **kwargs)
 
@@ -271,7 +368,7 @@ class Parser(object):
             return None
         fields = []
         while True:
-            match = self._FIELD_MATCHER.match(text[position:])
+            match = self._FIELD_MATCHER.match(text, position)
             if not match:
                 if not fields:
                     return None
@@ -279,11 +376,11 @@ class Parser(object):
             groups = match.groupdict()
             fields.append((self.parse_inline_markup(groups['label']),
                            self.parse_inline_markup(groups['value']),))
-            position += match.end() + 1
+            position = match.end() + 1
         return lcg.FieldSet(fields), position
 
     def _definition_processor(self, text, position, **kwargs):
-        match = self._DEFINITION_MATCHER.match(text[position:])
+        match = self._DEFINITION_MATCHER.match(text, position)
         if not match:
             return None
         definitions = []
@@ -292,17 +389,18 @@ class Parser(object):
             term, description = groups['term'], groups['description']
             if __debug__:
                 old_position = self._old_position
-            position += match.end()
+            position = match.end()
             next_position = position
             while True:
-                line_match = self._LINE_MATCHER.match(text[position:])
+                line_match = self._LINE_MATCHER.match(text, position)
                 if ((not line_match or
                      (line_match.group(2) and not line_match.group(1)) or
-                     line_match.end() == 0)):
+                     line_match.end() == position)):
                     break
-                position += line_match.end()
+                position = line_match.end()
             description += text[next_position:position]
-            parsed_description = self.parse(description)
+            parsed_description = self._parse_document(description,
+                                                      offset=match.start('description'))
             # Handle backward compatibility with the old structured text constructs
             if ((not definitions and
                  len(parsed_description) == 1 and
@@ -312,19 +410,19 @@ class Parser(object):
                 return None
             definitions.append((self.parse_inline_markup(term),
                                 lcg.Container(parsed_description),))
-            match = self._DEFINITION_MATCHER.match(text[position:])
+            match = self._DEFINITION_MATCHER.match(text, position)
         return lcg.DefinitionList(definitions), position
 
     def _hrule_processor(self, text, position, **kwargs):
-        match = self._HRULE_MATCHER.match(text[position:])
+        match = self._HRULE_MATCHER.match(text, position)
         if not match:
             return None
-        return lcg.HorizontalSeparator(), position + match.end()
+        return lcg.HorizontalSeparator(), match.end()
 
     def _section_processor(self, text, position, section_level=0, **kwargs):
         # section_level is ignored now, but it may become useful if we want to
         # restrict section levels by some rules.
-        match = self._SECTION_MATCHER.match(text[position:])
+        match = self._SECTION_MATCHER.match(text, position)
         if not match:
             return None
         title = match.group('title')
@@ -334,7 +432,7 @@ class Parser(object):
         level = len(match.group('level'))
         section_content = []
         size = len(text)
-        position += match.end()
+        position = match.end()
         kwargs = self._prune_kwargs(kwargs, ('section_level',))
         element_kwargs = {}
         if match.group('collapsible'):
@@ -347,7 +445,7 @@ class Parser(object):
             position = self._find_next_block(text, position)
             if position >= size:
                 break
-            match = self._SECTION_MATCHER.match(text[position:])
+            match = self._SECTION_MATCHER.match(text, position)
             if match and len(match.group('level')) <= level:
                 break
             content, position = self._parse(text, position, section_level=level, **kwargs)
@@ -359,16 +457,16 @@ class Parser(object):
                        in_toc=in_toc, **element_kwargs), position
 
     def _container_processor(self, text, position, section_level=0, **kwargs):
-        start = self._CONTAINER_MATCHER.match(text[position:])
+        start = self._CONTAINER_MATCHER.match(text, position)
         if not start:
             return None
-        position += start.end()
+        position = start.end()
         level = len(start.group('level'))
-        end = self._CONTAINER_END_MATCHER[level].search(text[position:])
+        end = self._CONTAINER_END_MATCHER[level].search(text, position)
         if not end:
             return None
-        content = self.parse(text[position:position + end.start()])
-        position += end.end()
+        content = self._parse_document(text[position:end.start()], offset=position)
+        position = end.end()
         id_, role, classes = None, None, []
         if start.group('id'):
             for x in start.group('id').strip().split():
@@ -395,33 +493,33 @@ class Parser(object):
         return container, position
 
     def _literal_processor(self, text, position, **kwargs):
-        match = self._LITERAL_MATCHER.match(text[position:])
+        match = self._LITERAL_MATCHER.match(text, position)
         if not match:
             return None
         content = lcg.PreformattedText(match.group(1))
-        return content, position + match.end()
+        return content, match.end()
 
     def _doctest_processor(self, text, position, **kwargs):
-        match = self._DOCTEST_MATCHER.match(text[position:])
+        match = self._DOCTEST_MATCHER.match(text, position)
         if not match:
             return None
         content = lcg.PreformattedText(match.group(0), mime_type='text/x-python-doctest')
-        return content, position + match.end()
+        return content, match.end()
 
     def _exercise_processor(self, text, position, **kwargs):
-        match = self._EXERCISE_MATCHER.match(text[position:])
+        match = self._EXERCISE_MATCHER.match(text, position)
         if not match:
             return None
         from . import exercises
-        parser = exercises.ExerciseParser()
+        parser = exercises.ExerciseParser(parser=self)
         exercise_type = getattr(exercises, match.group(1), None)
         if not exercise_type:
             return None
         content = parser.parse(exercise_type, match.group(2))
-        return content, position + match.end()
+        return content, match.end()
 
     def _toc_processor(self, text, position, **kwargs):
-        match = self._TOC_MATCHER.match(text[position:])
+        match = self._TOC_MATCHER.match(text, position)
         if not match:
             return None
         groups = match.groupdict()
@@ -433,11 +531,11 @@ class Parser(object):
         depth = None
         if groups['tocdepth']:
             depth = int(groups['tocdepth'])
-        return class_(title=title, depth=depth), position + match.end()
+        return class_(title=title, depth=depth), match.end()
 
     def _list_processor(self, text, position, indentation=0, extra_indentation=0, **kwargs):
         size = len(text)
-        match = self._LIST_MATCHER.match(text[position:])
+        match = self._LIST_MATCHER.match(text, position)
         if not match:
             return None
 
@@ -452,12 +550,12 @@ class Parser(object):
             else:
                 return lcg.ItemizedList.UPPER_ALPHA
         items = []
-        kind = list_kind(text, position + match.end(1))
-        list_indentation = extra_indentation + match.end(1)
-        inner_indentation = extra_indentation + match.end()
+        kind = list_kind(text, match.end(1))
+        list_indentation = extra_indentation + match.end(1) - position
+        inner_indentation = extra_indentation + match.end() - position
         kwargs = self._prune_kwargs(kwargs, ('processors', 'compressed',))
         while True:                     # consume list items
-            position += match.end()
+            position = match.end()
             inner_extra_indentation = inner_indentation
             item_content = []
             while True:                 # consume content of a single list item
@@ -495,16 +593,16 @@ class Parser(object):
                 items.append(lcg.Container(item_content))
             if position >= size or current_indentation != list_indentation:  # no next item
                 break
-            match = self._LIST_MATCHER.match(text[position:])
+            match = self._LIST_MATCHER.match(text, position)
             if not match:               # this is not a (next) list item
                 break
-            if list_kind(text, position + match.end(1)) != kind:
+            if list_kind(text, match.end(1)) != kind:
                 # list kind switch => start new list
                 break
         return lcg.ItemizedList(items, order=kind), position
 
     def _table_processor(self, text, position, halign=None, **kwargs):
-        if not self._TABLE_MATCHER.match(text[position:]):
+        if not self._TABLE_MATCHER.match(text, position):
             return None
         bars = None
         global_widths = None
@@ -526,9 +624,9 @@ class Parser(object):
             iterated = False
             # Get the line
             start_position = position = position + 1
-            eol = text[start_position:].find('\n')
+            eol = text.find('\n', start_position)
             if eol >= 0:
-                position += eol + 1
+                position = eol + 1
                 if text[position - 2] != '\r' and text[position:position + 1] == '\r':  # Mac
                     position += 1
             else:
@@ -618,21 +716,19 @@ class Parser(object):
 
     def _parameters_processor(self, text, position, parameters=None, presentation=None,
                               **kwargs):
-        match = self._PARAMETER_MATCHER.match(text[position:])
+        match = self._PARAMETER_MATCHER.match(text, position)
         if not match:
             return None
         identifier = match.group(1)
-        value = match.group(2)
-        position += match.end()
+        value, value_position = self._stripped(text, match.start(2), match.end(2))
+        position = match.end()
         while text[position:position + 1] in ('\r', '\n',):
             position += 1
-        if value:
-            value = value.strip()
         if not value:
-            match = re.search('^@end %s *\r?$' % (identifier,), text[position:], re.MULTILINE)
+            match = self._end_matcher(identifier).search(text, position)
             if match:
-                value = text[position:position + match.start()].strip()
-                position += match.end()
+                value, value_position = self._stripped(text, position, match.start())
+                position = match.end()
             else:                       # unfinished parameter
                 return None, position
         info = self._PARAMETERS.get(identifier)
@@ -642,7 +738,8 @@ class Parser(object):
                 value = function(value)
             if kind == 'parameter':
                 if parameters is not None:
-                    parameters[name] = lcg.Container(Parser().parse(value))
+                    parameters[name] = lcg.Container(self._parse_document(value,
+                                                                          offset=value_position))
             elif kind == 'presentation':
                 setattr(presentation, name, value)
             else:
@@ -650,66 +747,75 @@ class Parser(object):
         return None, position
 
     def _variable_processor(self, text, position, **kwargs):
-        match = self._VARIABLE_MATCHER.match(text[position:])
+        match = self._VARIABLE_MATCHER.match(text, position)
         if not match:
             return None
         identifier = match.group(1)
         value = match.group(2)
-        position += match.end()
+        position = match.end()
         while text[position:position + 1] in ('\r', '\n',):
             position += 1
         if value:
             value = value.strip()
             variable_content = self.parse_inline_markup(value)
         else:
-            match = re.search('^@end %s *\r?$' % (identifier,), text[position:], re.MULTILINE)
+            match = self._end_matcher(identifier).search(text, position)
             if match:
-                value = text[position:position + match.start()].strip()
-                position += match.end()
+                value, value_position = self._stripped(text, position, match.start())
+                position = match.end()
             else:                       # unfinished variable
                 return None, position
-            variable_content = lcg.Container(self.parse(value))
+            variable_content = lcg.Container(self._parse_document(value, offset=value_position))
         content = lcg.SetVariable(unistr(identifier), variable_content)
         return content, position
 
     def _style_processor(self, text, position, **kwargs):
-        match = self._STYLE_MATCHER.match(text[position:])
+        match = self._STYLE_MATCHER.match(text, position)
         if not match:
             return None
         name = match.group(1)
-        text_start = position + match.end()
+        text_start = match.end()
         while text[text_start:text_start + 1] in ('\r', '\n',):
             text_start += 1
-        match = re.search('^@end style *\r?$', text[text_start:], re.MULTILINE)
+        match = self._end_matcher('style').search(text, text_start)
         if not match:
             return None, position
-        text_end = text_start + match.start()
-        end_position = text_start + match.end()
-        cut_text = text[:text_end]
-        position = text_start
+        end_position = match.end()
+        # Only the style body is copied, positions below are relative to it.
+        body = text[text_start:match.start()]
+        size = len(body)
+        if __debug__:
+            self._old_position = -1
         content_list = []
-        position = self._find_next_block(text, position)
-        while True:
-            if position >= text_end:
-                break
-            content, position = self._parse(cut_text, position, **kwargs)
-            if content is None:
-                break
-            content_list.append(content)
-            if position >= text_end:
-                break
-            position = self._find_next_block(text, position)
+        line_map = self._line_map
+        if line_map is not None:
+            # The body is already preprocessed, it is just shifted.
+            self._line_map = self._LineMap(body, [], [], parent=line_map, offset=text_start)
+        try:
+            position = self._find_next_block(body, 0)
+            while True:
+                if position >= size:
+                    break
+                content, position = self._parse(body, position, **kwargs)
+                if content is None:
+                    break
+                content_list.append(content)
+                if position >= size:
+                    break
+                position = self._find_next_block(body, position)
+        finally:
+            self._line_map = line_map
         if not content_list:
             return None, end_position
         container = lcg.Container(content_list, name=name)
         return container, end_position
 
     def _space_processor(self, text, position, **kwargs):
-        match = self._VSPACE_MATCHER.match(text[position:])
+        match = self._VSPACE_MATCHER.match(text, position)
         if not match:
             return None
         value = float(match.group(1))
-        position += match.end()
+        position = match.end()
         content = lcg.VSpace(lcg.UMm(value))
         return content, position
 
@@ -726,38 +832,75 @@ class Parser(object):
 
     def _whitespace_processor(self, text, position, **kwargs):
         next_position = position
-        while text[next_position:] and text[next_position] in string.whitespace:
+        size = len(text)
+        while next_position < size and text[next_position] in string.whitespace:
             next_position += 1
         content = lcg.Paragraph(self.parse_inline_markup(''))
         return content, next_position
 
-    def _strip_comments(self, text):
-        stripped_text = ''
-        while True:
-            match = self._COMMENT_MATCHER.search(text)
-            if not match:
-                break
-            stripped_text += text[:match.start()]
-            text = text[match.end():]
-        stripped_text += text
-        return stripped_text
+    def _stripped(self, text, start, end):
+        # Return the stripped text between 'start' and 'end' and its position in 'text'.
+        if start < 0:
+            return None, start
+        value = text[start:end].lstrip()
+        return value.rstrip(), end - len(value)
 
-    def _expand_tabs(self, text):
-        # Well, non-linear time complexity here
-        while True:
-            match = self._TAB_MATCHER.search(text)
-            if not match:
-                break
-            text = text[:match.start()] + ' ' * 8 + text[match.end():]
-        return text
+    def _preprocess(self, text, offset=None):
+        """Return the source text prepared for parsing and its '_LineMap'.
+
+        Comment lines are removed and a tab at the beginning of the text is
+        expanded to spaces.  Both is done in a single pass over the text.
+
+        If 'offset' is not None, 'text' is a fragment found at given position
+        of the currently parsed text.
+
+        """
+        pieces = []
+        positions = []
+        shifts = []
+        position = 0
+        shift = 0  # The number of characters to add to get the source position.
+        for match in self._PREPROCESSING_MATCHER.finditer(text):
+            start, end = match.span()
+            if text[start] == '\t':
+                if start != shift:
+                    # Only the tab at the very beginning of the text is expanded.
+                    continue
+                pieces.append(' ' * 8)
+                shift -= 7
+                positions.append(8)
+            else:
+                pieces.append(text[position:start])
+                shift += end - start
+                positions.append(end - shift)
+            shifts.append(shift)
+            position = end
+        if pieces:
+            pieces.append(text[position:])
+            preprocessed = ''.join(pieces)
+        else:
+            preprocessed = text
+        if offset is None:
+            line_map = self._LineMap(text, positions, shifts)
+        else:
+            line_map = self._LineMap(text, positions, shifts, parent=self._line_map,
+                                     offset=offset)
+        return preprocessed, line_map
+
+    def _locate_error(self, exception, position):
+        # Add the source line information to an exception raised while parsing
+        # the block at 'position'.  Only the innermost block is reported.
+        if exception is not self._located_error and self._line_map is not None:
+            self._located_error = exception
+            lcg.add_processing_info(exception, 'Line', unistr(self._line_map.line(position)))
 
     def _skip_content(self, text, position, indentation=0, extra_indentation=0, compressed=False):
         while True:
-            if ((self._LITERAL_MATCHER.match(text[position:]) or
-                 self._LIST_MATCHER.match(text[position:]))):
+            if ((self._LITERAL_MATCHER.match(text, position) or
+                 self._LIST_MATCHER.match(text, position))):
                 # some blocks don't have to be separated by blank lines
                 break
-            match = self._LINE_MATCHER.match(text[position:])
+            match = self._LINE_MATCHER.match(text, position)
             if not match:               # end of text?
                 break
             if not match.group(2):      # blank line?
@@ -765,9 +908,9 @@ class Parser(object):
             if match.end(1) - match.start(1) + extra_indentation < indentation:
                 # reduced indentation?
                 break
-            if compressed and self._LIST_MATCHER.match(text[position:]):  # inner list
+            if compressed and self._LIST_MATCHER.match(text, position):  # inner list
                 break
-            position += match.end()
+            position = match.end()
             extra_indentation = 0
         return position
 
@@ -786,21 +929,55 @@ class Parser(object):
                 start_position = position
         return start_position
 
+    def _update_dispatch_table(self):
+        # Build the dictionary of processors keyed by the first block character.
+        processors = self._processors
+        characters = []
+        for processor in processors:
+            start_characters = self._PROCESSOR_START_CHARACTERS.get(processor.__name__)
+            if start_characters is not None:
+                characters.extend(start_characters)
+        table = {}
+        for char in characters:
+            table[char] = tuple(p for p in processors
+                                if char in self._PROCESSOR_START_CHARACTERS.get(p.__name__, char))
+        self._dispatch_table = table
+        self._dispatch_default = tuple(p for p in processors
+                                       if p.__name__ not in self._PROCESSOR_START_CHARACTERS)
+        self._dispatched_processors = processors
+
     def _parse(self, text, position, processors=None, **kwargs):
         assert position > self._old_position, \
             (self._old_position, position, text[position:position + 100],)
         if __debug__:
             self._old_position = position
-        for processor in (processors or self._processors):
-            result = processor(text, position, **kwargs)
-            if result is not None:
-                if __debug__:
-                    position = result[1]
-                    assert position >= min(self._old_position + 1, len(text)), \
-                        (self._old_position, position, text[position:position + 100], processor,)
-                return result
-        else:
-            raise Exception('Unhandled text', text[position:])
+        if not processors:
+            if self._dispatched_processors is not self._processors:
+                self._update_dispatch_table()
+            processors = self._dispatch_table.get(text[position:position + 1],
+                                                  self._dispatch_default)
+        statistics = self._statistics
+        try:
+            for processor in processors:
+                result = processor(text, position, **kwargs)
+                if statistics is not None:
+                    name = processor.__name__
+                    hits, misses = statistics.get(name, (0, 0))
+                    if result is None:
+                        statistics[name] = (hits, misses + 1)
+                    else:
+                        statistics[name] = (hits + 1, misses)
+                if result is not None:
+                    if __debug__:
+                        end = result[1]
+                        assert end >= min(self._old_position + 1, len(text)), \
+                            (self._old_position, end, text[end:end + 100], processor,)
+                    return result
+            else:
+                raise Exception('Unhandled text', text[position:])
+        except Exception as e:
+            self._locate_error(e, position)
+            raise
 
     def _substitution_markup_handler(self, markup, subst):
         # get the substitution value for _SUBSTITUTION_REGEX match
@@ -809,7 +986,7 @@ class Parser(object):
         if subst:
             return lcg.Substitution(subst, markup=markup)
         else:
-            return lcg.TextContent(markup)
+            return self._text_content(markup)
 
     def _link_markup_handler(self, link, href=None, size=None, label=None, descr=None, align=None):
         def _basename(filename):
@@ -884,7 +1061,7 @@ class Parser(object):
         return lcg.TotalPages()
 
     def _escape_markup_handler(self, markup):
-        return lcg.TextContent(markup)
+        return self._text_content(markup)
 
     def _email_markup_handler(self, email):
         return lcg.Link(lcg.Link.ExternalTarget('mailto:' + email, email))
@@ -933,9 +1110,9 @@ class Parser(object):
         initial_backslashes = (number_of_backslashes // 2) * '\\'
         if number_of_backslashes % 2:
             # If the number of backslashes is odd, the markup is escaped (printed as is).
-            return [lcg.TextContent(initial_backslashes + markup)]
+            return [self._text_content(initial_backslashes + markup)]
         if initial_backslashes:
-            append(lcg.TextContent(initial_backslashes))
+            append(self._text_content(initial_backslashes))
         result = []
         # We need two variables (start and end), because both can be False for
         # unpaired markup.
@@ -964,7 +1141,51 @@ class Parser(object):
             # Markup in an invalid context is just printed as is.
             # This can be end markup, which was not opened or start markup,
             # which was already opened.
-            result.append(lcg.TextContent(markup))
+            result.append(self._text_content(markup))
+        return result
+
+    def statistics(self):
+        """Return the block processor statistics or None if not enabled.
+
+        The statistics are only collected when the parser was created with
+        'statistics=True'.  The returned dictionary is keyed by processor
+        method names and the values are pairs (HITS, MISSES), where HITS is
+        the number of blocks processed by given processor and MISSES is the
+        number of blocks the processor was tried for, but refused them.
+        Processors skipped thanks to the first character of the block don't
+        count as misses.
+
+        """
+        if self._statistics is None:
+            return None
+        return dict(self._statistics)
+
+    def inline_cache_statistics(self):
+        """Return the inline markup cache statistics or None if not enabled.
+
+        The cache is only used when the parser was created with nonzero
+        'inline_cache_size'.  The returned value is a triple (HITS, MISSES,
+        SIZE), where HITS is the number of 'parse_inline_markup()' calls
+        served from the cache, MISSES is the number of calls which actually
+        parsed the text and SIZE is the current number of cached results.
+
+        """
+        if not self._inline_cache_size:
+            return None
+        return self._inline_cache_hits, self._inline_cache_misses, len(self._inline_cache)
+
+    def _copy_inline_content(self, content):
+        # Return a copy of the cached inline content.  Content elements are
+        # not reusable (each has its own container), so the whole tree must
+        # be copied, but this is still much cheaper than parsing.
+        result = content.__class__.__new__(content.__class__)
+        result.__setstate__(content.__getstate__())
+        if isinstance(content, lcg.Container):
+            items = tuple([self._copy_inline_content(c) for c in content._content])
+            for i, c in enumerate(items):
+                c.set_container(result)
+                c._position = i
+            result._content = items
         return result
 
     def parse_inline_markup(self, text):
@@ -974,7 +1195,31 @@ class Parser(object):
         method only parses inline constructs within the blocks processed by
         'parse()'.  The inline constructs are links, text emphasizing etc.
 
+        If the inline cache is enabled (see the constructor argument
+        'inline_cache_size'), the result for a previously parsed text is a
+        fresh copy of the cached result, so the caller may use it freely.
+
         """
+        if not self._inline_cache_size:
+            return self._parse_inline_markup(text)
+        cache = self._inline_cache
+        try:
+            content = cache.pop(text)
+        except KeyError:
+            self._inline_cache_misses += 1
+            content = self._parse_inline_markup(text)
+            if len(cache) >= self._inline_cache_size:
+                cache.popitem(last=False)
+        else:
+            self._inline_cache_hits += 1
+        cache[text] = content
+        return self._copy_inline_content(content)
+
+    def _text_content(self, text):
+        # Texts are interned as the same texts often repeat in the document.
+        return lcg.TextContent(lcg.intern_text(text))
+
+    def _parse_inline_markup(self, text):
         stack = []
         result = []
         pos = 0
@@ -987,12 +1232,12 @@ class Parser(object):
         for match in self._inline_markup.finditer(text):
             preceding_text = text[pos:match.start()]
             if preceding_text:
-                append(lcg.TextContent(preceding_text))
+                append(self._text_content(preceding_text))
             append(*self._markup_handler(stack, match, append))
             pos = match.end()
         final_text = text[pos:]
         if final_text:
-            append(lcg.TextContent(final_text))
+            append(self._text_content(final_text))
         while stack:
             entry = stack.pop()
             handler = getattr(self, '_' + entry.name + '_markup_handler')
@@ -1012,26 +1257,66 @@ class Parser(object):
 
         """
         assert isinstance(text, basestring), text
+        return self._parse_document(text, parameters)
+
+    def iterparse(self, text_or_file, parameters=None):
+        """Parse given text and generate top level content elements one by one.
+
+        The same as 'parse()', but the top level 'Content' instances are
+        yielded as soon as they are complete, so that the caller may process
+        them while the rest of the document is being parsed.
+
+        Arguments:
+
+          text_or_file -- input structured text, string or unicode or an open
+            file object (in text mode).  The file is read as a whole, because
+            the block level constructs may span any part of the text.
+          parameters -- 'None' or a dictionary where keyword parameters for
+            'ContentNode' constructor are stored to.  The parameters are
+            stored as they are found in the text, so the dictionary is only
+            complete (including 'presentation') when the generator is
+            exhausted.
+
+        """
+        if isinstance(text_or_file, basestring):
+            text = text_or_file
+        else:
+            text = text_or_file.read()
+        assert isinstance(text, basestring), text
+        return self._iterparse_document(text, parameters)
+
+    def _parse_document(self, text, parameters=None, offset=None):
+        # Parse 'text' as a whole document.  If 'offset' is not None, 'text' is
+        # a fragment found at given position of the currently parsed text.
+        return list(self._iterparse_document(text, parameters=parameters, offset=offset))
+
+    def _iterparse_document(self, text, parameters=None, offset=None):
+        # The parser state is only set while a block is being parsed, because
+        # the parser may be used for other purposes while the generator is
+        # suspended.
         if __debug__:
-            self._old_position = -1
+            old_position = -1
+        line_map = self._line_map
         presentation = lcg.Presentation()
-        text = self._strip_comments(text)
-        text = self._expand_tabs(text)
-        contents = []
-        position = 0
+        text, document_line_map = self._preprocess(text, offset=offset)
         size = len(text)
-        position = self._find_next_block(text, position)
-        while True:
-            if position >= size:
-                break
-            content, position = self._parse(text, position, parameters=parameters,
-                                            presentation=presentation)
+        position = self._find_next_block(text, 0)
+        while position < size:
+            if __debug__:
+                self._old_position = old_position
+            self._line_map = document_line_map
+            try:
+                content, position = self._parse(text, position, parameters=parameters,
+                                                presentation=presentation)
+            finally:
+                self._line_map = line_map
+            if __debug__:
+                old_position = self._old_position
             if content is not None:
-                contents.append(content)
+                yield content
             position = self._find_next_block(text, position)
         if parameters is not None:
             parameters['presentation'] = presentation
-        return contents
 
 
 class MacroParser(object):
@@ -1074,11 +1359,15 @@ class MacroParser(object):
     """
     _CONDITION_REGEX = re.compile(r'(?m)^(@(?:if .+|else|endif))\s*?$\r?\n?')
     _INCLUDE_REGEX = re.compile(r'(?m)^@include (.*)\r?$')
+    _SAFE_BUILTINS = ('False', 'None', 'True', 'abs', 'all', 'any', 'bool', 'bytes',
+                      'chr', 'complex', 'dict', 'divmod', 'float', 'hash', 'hex',
+                      'id', 'isinstance', 'int', 'len', 'list', 'max', 'min', 'oct',
+                      'ord', 'pow', 'range', 'repr', 'reversed', 'round', 'set',
+                      'slice', 'sorted', 'str', 'sum', 'tuple', 'zip')
 
     class _ConditionalText(object):
 
-        def __init__(self, evaluate, condition, parent=None):
-            self._evaluate = evaluate
+        def __init__(self, condition, parent=None):
             self._condition = condition
             self.parent = parent
             self._state = True
@@ -1090,13 +1379,70 @@ class MacroParser(object):
         def append(self, content):
             self._content[self._state].append(content)
 
-        def __str__(self):
-            try:
-                result = self._evaluate(self._condition)
-            except Exception as e:
-                return e.__class__.__name__ + ': ' + unistr(e)
+        def render(self, evaluate):
+            if self._condition is None:
+                result = True
             else:
-                return ''.join([unistr(x) for x in self._content[bool(result)]])
+                try:
+                    result = evaluate(self._condition)
+                except Exception as e:
+                    return e.__class__.__name__ + ': ' + unistr(e)
+            return ''.join([x if isinstance(x, basestring) else x.render(evaluate)
+                            for x in self._content[bool(result)]])
+
+    class Template(object):
+        """Macro text prepared for repeated processing by 'MacroParser.compile()'.
+
+        The text is split into macros only once and the conditions are only
+        compiled once, so rendering the same template many times with
+        different globals is much cheaper than calling 'MacroParser.parse()'
+        repeatedly.
+
+        """
+
+        def __init__(self, parser, text):
+            self._parser = parser
+            self._parts = parser._INCLUDE_REGEX.split(text)
+            if len(self._parts) == 1:
+                self._conditional_text = parser._split_conditions(text)
+            else:
+                # The included text may contain conditions, so the conditions
+                # may be only split after inclusion (the last result is cached).
+                self._conditional_text = None
+            self._included_text = None
+            self._included_conditional_text = None
+
+        def render(self, globals=None):
+            """Return the text with all macros processed.
+
+            Arguments:
+
+              globals -- dictionary of variables used by the default inclusion
+                and evaluation methods or None to use the globals passed to
+                the parser constructor.
+
+            """
+            parser = self._parser
+            # The default inclusion and evaluation methods use the parser's
+            # globals, so they are replaced for the duration of the call.
+            saved = parser._globals, parser._evaluation_globals
+            if globals is not None:
+                parser._globals = globals
+            if parser._evaluate == parser._default_evaluate:
+                parser._evaluation_globals = parser._make_evaluation_globals()
+            try:
+                conditional_text = self._conditional_text
+                if conditional_text is None:
+                    include = parser._include
+                    text = ''.join([include(part.strip()) if i % 2 else part
+                                    for i, part in enumerate(self._parts)])
+                    if text != self._included_text:
+                        self._included_conditional_text = parser._split_conditions(text)
+                        self._included_text = text
+                    conditional_text = self._included_conditional_text
+                return conditional_text.render(parser._evaluate)
+            finally:
+                parser._globals, parser._evaluation_globals = saved
 
     def __init__(self, globals=None, evaluate=None, include=None):
         """Arguments:
@@ -1114,17 +1460,27 @@ class MacroParser(object):
         self._globals = globals or {}
         self._evaluate = evaluate or self._default_evaluate
         self._include = include or self._default_include
+        self._safe_builtins = dict((builtin, __builtins__[builtin])
+                                   for builtin in self._SAFE_BUILTINS)
+        self._conditions = {}
+        # The evaluation namespace built from '_globals' (only kept while
+        # rendering a template, see 'Template.render()').
+        self._evaluation_globals = None
+
+    def _make_evaluation_globals(self):
+        result = dict(self._globals, __builtins__=None)
+        result.update(self._safe_builtins)
+        return result
 
     def _default_evaluate(self, expr):
-        safe_builtins = ('False', 'None', 'True', 'abs', 'all', 'any', 'bool', 'bytes',
-                         'chr', 'complex', 'dict', 'divmod', 'float', 'hash', 'hex',
-                         'id', 'isinstance', 'int', 'len', 'list', 'max', 'min', 'oct',
-                         'ord', 'pow', 'range', 'repr', 'reversed', 'round', 'set',
-                         'slice', 'sorted', 'str', 'sum', 'tuple', 'zip')
-        globals = dict(self._globals, __builtins__=None)
-        for builtin in safe_builtins:
-            globals[builtin] = __builtins__[builtin]
-        return eval("bool(%s)" % expr, globals, {})
+        globals = self._evaluation_globals
+        if globals is None:
+            globals = self._make_evaluation_globals()
+        try:
+            code = self._conditions[expr]
+        except KeyError:
+            code = self._conditions[expr] = compile("bool(%s)" % expr, '<string>', 'eval')
+        return eval(code, globals, {})
 
     def _default_include(self, name):
         try:
@@ -1132,14 +1488,15 @@ class MacroParser(object):
         except KeyError:
             return ''
 
-    def parse(self, text):
-        """Return the text with all macros processed."""
-        text = self._INCLUDE_REGEX.sub(lambda m: self._include(m.group(1).strip()), text)
+    def _split_conditions(self, text):
         tokens = self._CONDITION_REGEX.split(text)
-        result = current = self._ConditionalText(self._evaluate, True)
-        for t in tokens:
-            if t.startswith('@if'):
-                new = self._ConditionalText(self._evaluate, t[4:].strip(), parent=current)
+        result = current = self._ConditionalText(None)
+        # Odd tokens are the macros matched by the regular expression.
+        for i, t in enumerate(tokens):
+            if i % 2 == 0:
+                current.append(t)
+            elif t.startswith('@if'):
+                new = self._ConditionalText(t[4:].strip(), parent=current)
                 current.append(new)
                 current = new
             elif t == '@else':
@@ -1148,7 +1505,19 @@ class MacroParser(object):
                 current = current.parent
             else:
                 current.append(t)
-        return unistr(result)
+        return result
+
+    def compile(self, text):
+        """Return a 'MacroParser.Template' instance for given text.
+
+        The template may be rendered repeatedly with different globals.
+
+        """
+        return self.Template(self, text)
+
+    def parse(self, text):
+        """Return the text with all macros processed."""
+        return self.compile(text).render()
 
 
 class HTMLProcessor(object):
@@ -1535,39 +1904,15 @@ class HTMLProcessor(object):
             return class_(content, align=align)
 
         def _make_matchers(self):
-            matchers = self._matchers()
-            compiled_matchers = []
-            for test, handler in matchers:
-                if isinstance(test, basestring):
-                    test = (test,)
-                if isinstance(test, (tuple, list)):
-                    tag_regexp = re.compile(test[0] + '$')
-                    attr_tests = [(a, re.compile(r),) for a, r in test[1:]]
-
-                    def test_function(element, tag_regexp=tag_regexp, attr_tests=attr_tests):
-                        if not tag_regexp.match(element.tag):
-                            return False
-                        for attr, regexp in attr_tests:
-                            try:
-                                value = element.attrib[attr]
-                            except KeyError:
-                                return False
-                            if not regexp.match(value + '$'):
-                                return False
-                        return True
-                elif callable(test):
-                    test_function = test
-                else:
-                    raise Exception("Invalid matcher test specification", test)
-                if not isinstance(handler, (tuple, list)):
-                    handler = (handler, {})
-                compiled_matchers.append((test_function, handler))
-            self._compiled_matchers = compiled_matchers
+            # Imported here to avoid importing 'lcg.transform' while 'lcg' is
+            # being initialized.
+            from lcg.transform import index_matchers
+            self._tag_matchers, self._fallback_matchers = index_matchers(self._matchers())
 
         def transform(self, element, _followers=None):
             if _followers is None:
                 _followers = []
-            for test, handler in self._compiled_matchers:
+            for test, handler in self._tag_matchers.get(element.tag, self._fallback_matchers):
                 if test(element):
                     function, kwargs = handler
                     return function(element, _followers, **kwargs)
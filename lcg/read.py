@@ -21,10 +21,15 @@
 
 from __future__ import unicode_literals
 import codecs
+import functools
 import glob
+import hashlib
+import multiprocessing
 import os
+import pickle
 import re
 import sys
+import tempfile
 import unicodedata
 
 import lcg
@@ -34,6 +39,17 @@ if sys.version_info[0] > 2:
     basestring = str
 
 
+class VariantReadError(IOError):
+    """Error reading the source of a language variant on access in lazy mode.
+
+    Raised instead of the original 'IOError' (see the 'Reader' constructor
+    argument 'lazy'), so that errors reading the sources during export can be
+    distinguished from other I/O errors, such as errors writing the output.
+
+    """
+    pass
+
+
 class Reader(object):
     """LCG content hierarchy reader.
 
@@ -54,7 +70,8 @@ class Reader(object):
 
     """
 
-    def __init__(self, id, parent=None, hidden=False, resource_provider=None):
+    def __init__(self, id, parent=None, hidden=False, resource_provider=None, jobs=None,
+                 lazy=False):
         """Initialize the instance.
 
         Arguments:
@@ -64,12 +81,29 @@ class Reader(object):
           hidden -- boolean flag passed to the created 'ContentNode' constructor
           resource_provider -- 'ResourceProvider' instance or None.  An instance may only be passed
             to the root reader, child readers will automatically use the root's resource provider.
+          jobs -- number of processes used to read the source documents in parallel.  None or 1
+            means reading serially in the current process.  May only be passed to the root
+            reader.  Only documents supporting parallel reading (see '_read_task()') are read
+            in parallel, the resulting hierarchy is the same as when reading serially.
+          lazy -- if true, the language variants of all nodes are only read when they are
+            accessed for the first time (see 'lcg.LazyVariant').  This avoids reading the
+            variants which are not needed, such as when exporting just one language.  May only be
+            passed to the root reader.  The sources are not read in parallel in this mode
+            ('jobs' is ignored) and errors in source documents are only reported on access.
+            Errors reading the source files are then raised as 'VariantReadError'.
 
         """
         super(Reader, self).__init__()
+        assert jobs is None or isinstance(jobs, int) and jobs > 0, jobs
+        assert parent is None or jobs is None, (id, jobs)
+        assert parent is None or not lazy, (id, lazy)
         self._id = id
         self._parent = parent
         self._hidden = hidden
+        self._jobs = jobs
+        self._lazy = lazy
+        self._child_readers_ = None
+        self._prefetched = {}
         if parent is None:
             root = self
             if resource_provider is None:
@@ -110,6 +144,74 @@ class Reader(object):
     def _globals(self):
         return {}
 
+    def _read_task(self, lang):
+        """Return the task for reading given language variant in a worker process or None.
+
+        The returned value must be a picklable pair (KWARGS, LANG), where KWARGS are
+        'DocFileReader' constructor arguments.  Such reader will be used to read and parse the
+        document in the worker process.  The result is then returned by '_prefetched_document()'.
+        None means that the document doesn't support parallel reading and will be read by this
+        reader as usual.
+
+        """
+        return None
+
+    def _prefetched_document(self, lang):
+        """Return the result of reading given language variant in a worker process or None."""
+        return self._prefetched.pop(lang, None)
+
+    def _child_readers(self):
+        # The readers are created only once, so that the documents read in parallel are passed to
+        # the same reader instances which later build the nodes.
+        if self._child_readers_ is None:
+            self._child_readers_ = tuple(self._children())
+        return self._child_readers_
+
+    def _read_parallel(self, jobs):
+        tasks = []
+
+        def collect(reader):
+            for lang in reader._variants() or (None,):
+                task = reader._read_task(lang)
+                if task is not None:
+                    tasks.append((reader, lang, task))
+            for child in reader._child_readers():
+                collect(child)
+        collect(self)
+        if len(tasks) < 2:
+            return
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            results = pool.map(_read_document, [task for reader, lang, task in tasks])
+        finally:
+            pool.close()
+            pool.join()
+        for (reader, lang, task), result in zip(tasks, results):
+            if result is not None:
+                reader._prefetched[lang] = result
+
+    def _add_source_info(self, exception):
+        if hasattr(self, '_source_filename'):
+            # TODO: This is a quick hack.  The attribute `_source_filename' is prefilled in
+            # 'FileReader._read_file', so it would be at least more appropriate to move this
+            # hack into the 'FileReader' class.  Even then, there is no guarantee, that the
+            # exception was actually raised during processing this file.
+            lcg.add_processing_info(exception, 'File', self._source_filename)
+
+    def _read_lazily(self, function, lang):
+        # Call function(lang) on demand in lazy mode, annotating errors as 'build()' does.
+        try:
+            return function(lang)
+        except IOError as e:
+            self._add_source_info(e)
+            error = VariantReadError(*(e.args if e.filename is None else e.args + (e.filename,)))
+            # Retain the additional information, such as the processing details.
+            error.__dict__.update(e.__dict__)
+            raise error
+        except Exception as e:
+            self._add_source_info(e)
+            raise
+
     def parent(self):
         return self._parent
 
@@ -118,9 +220,16 @@ class Reader(object):
 
     def build(self):
         """Build hierarchy of 'ContentNode' instances and return the root node."""
+        if self._jobs and self._jobs > 1 and not self._lazy:
+            self._read_parallel(self._jobs)
         try:
             variants = self._variants()
-            if variants:
+            if variants and self._root._lazy:
+                kwargs = dict(variants=[lcg.LazyVariant(lang, functools.partial(self._read_lazily,
+                                                                                self._content,
+                                                                                lang))
+                                        for lang in variants])
+            elif variants:
                 # There is one or more known source language (files have the lang extension).
                 kwargs = dict(variants=[lcg.Variant(lang, **self._content(lang))
                                         for lang in variants])
@@ -131,22 +240,31 @@ class Reader(object):
                                    title=self._title(),
                                    brief_title=self._brief_title(),
                                    descr=self._descr(),
-                                   children=[child.build() for child in self._children()],
+                                   children=[child.build() for child in self._child_readers()],
                                    resource_provider=self._resource_provider_,
                                    globals=self._globals(),
                                    hidden=self._hidden,
                                    **kwargs)
 
         except Exception as e:
-            if hasattr(self, '_source_filename'):
-                # TODO: This is a quick hack.  The attribute `_source_filename' is prefilled in
-                # 'FileReader._read_file', so it would be at least more appropriate to move this
-                # hack into the 'FileReader' class.  Even then, there is no guarantee, that the
-                # exception was actually raised during processing this file.
-                e = lcg.add_processing_info(e, 'File', self._source_filename)
+            self._add_source_info(e)
             raise
 
 
+class _LazyTitles(dict):
+    """Dictionary of variant titles read on demand for 'SelfTranslatableText' (in lazy mode)."""
+
+    def __init__(self, read, langs):
+        super(_LazyTitles, self).__init__()
+        self._read = read
+        self._langs = langs
+
+    def get(self, lang, default=None):
+        if lang in self._langs and lang not in self:
+            self[lang] = self._read(lang)
+        return super(_LazyTitles, self).get(lang, default)
+
+
 class FileReader(Reader):
 
     # Byte Order Mark (see http://en.wikipedia.org/wiki/Byte-order_mark).
@@ -238,22 +356,96 @@ class StructuredTextReader(FileReader):
 
     """
 
+    _CACHE_FORMAT = 1
+    """Version of the parse cache file format.  Cache files of other versions are ignored."""
+
     def __init__(self, *args, **kwargs):
+        """Initialize the instance.
+
+        Arguments:
+
+          cache_dir -- name of the directory where the parse results of source files are cached
+            between runs or None to parse the sources always.  If None and the parent reader is a
+            'StructuredTextReader', the parent's cache directory is used.  The directory is
+            created if it doesn't exist.  The cached result is only used if the path,
+            modification time, size and content of the source file match.  Only documents
+            read from files (see '_source_file()') are cached.
+
+          The other arguments are inherited from the parent class.
+
+        """
+        cache_dir = kwargs.pop('cache_dir', None)
         self._parser = lcg.Parser()
         self._titles = {}
+        self._documents = {}
         super(StructuredTextReader, self).__init__(*args, **kwargs)
+        if cache_dir is None and isinstance(self._parent, StructuredTextReader):
+            cache_dir = self._parent.cache_dir()
+        self._cache_dir = cache_dir
 
     def _source_text(self, lang):
         return None
 
-    def _parse_text(self, text):
+    def _source_file(self, lang):
+        # Return the path of the file '_source_text()' reads for 'lang' or None.
+        return None
+
+    def _cache_key(self, text, filename):
+        # Return the pair (CACHE_FILE, HEADER) for given source file or None.
+        if self._cache_dir is None or filename is None:
+            return None
+        path = os.path.abspath(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        header = (self._CACHE_FORMAT, lcg.__version__, path, stat.st_mtime, stat.st_size, digest)
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest() + '.pickle'
+        return os.path.join(self._cache_dir, name), header
+
+    def _load_cached(self, cache_file, header):
+        try:
+            with open(cache_file, 'rb') as f:
+                if pickle.load(f) != header:
+                    return None
+                return pickle.load(f)
+        except Exception:
+            # Missing, corrupted or incompatible cache file - just parse the source.
+            return None
+
+    def _save_cached(self, cache_file, header, result):
+        try:
+            if not os.path.isdir(self._cache_dir):
+                os.makedirs(self._cache_dir)
+            # Write to a temporary file first to never leave a partially written cache file.
+            fd, tmpname = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+                    pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+                os.rename(tmpname, cache_file)
+            except Exception:
+                os.remove(tmpname)
+                raise
+        except Exception as e:
+            lcg.log("Unable to write parse cache file %s: %s", cache_file, e)
+
+    def _parse_text(self, text, filename=None):
+        cache_key = self._cache_key(text, filename)
+        if cache_key is not None:
+            result = self._load_cached(*cache_key)
+            if result is not None:
+                return result
         parser = self._parser
         parameters = {}
-        result = parser.parse(text, parameters)
-        return result, parameters
+        result = parser.parse(text, parameters), parameters
+        if cache_key is not None:
+            self._save_cached(cache_key[0], cache_key[1], result)
+        return result
 
-    def _document(self, text):
-        sections, parameters = self._parse_text(text)
+    def _document(self, text, filename=None):
+        sections, parameters = self._parse_text(text, filename=filename)
         if len(sections) != 1 or not isinstance(sections[0], lcg.Section):
             raise Exception("The document has no top-level section:", (self._id, sections,))
         s = sections[0]
@@ -261,9 +453,35 @@ class StructuredTextReader(FileReader):
         sections = s.content()
         return title, lcg.Container(sections), parameters
 
+    def _read_document(self, lang):
+        # Return the triple (title, content, parameters) for given language.  The document is
+        # only read once even if both its title and content are requested (in lazy mode).
+        try:
+            return self._documents[lang]
+        except KeyError:
+            document = self._prefetched_document(lang)
+            if document is None:
+                document = self._document(self._source_text(lang),
+                                          filename=self._source_file(lang))
+            self._documents[lang] = document
+            self._titles[lang] = document[0]
+            return document
+
+    def _variant_title(self, lang):
+        return self._read_document(lang)[0]
+
     def _title(self):
         # This method is called after _content(), is called for each
         # language, so the dictionary of titles is already built.
+        # In lazy mode, the titles are read on demand, when they are
+        # localized (or all at once if there is just one variant).
+        variants = self._variants()
+        if self._root._lazy and len(variants) > 1:
+            titles = _LazyTitles(functools.partial(self._read_lazily, self._variant_title),
+                                 variants)
+            return lcg.SelfTranslatableText(self._id, translations=titles)
+        for lang in variants:
+            self._read_document(lang)
         if len(self._titles.keys()) == 1:
             title = list(self._titles.values())[0]
         else:
@@ -271,10 +489,13 @@ class StructuredTextReader(FileReader):
         return title
 
     def _content(self, lang):
-        title, content, parameters = self._document(self._source_text(lang))
-        self._titles[lang] = title
+        title, content, parameters = self._read_document(lang)
         return dict(content=content, **parameters)
 
+    def cache_dir(self):
+        """Return the name of the parse cache directory or None if caching is off."""
+        return self._cache_dir
+
 
 class DocFileReader(StructuredTextReader):
     """Node of a Structured Text read from a source file."""
@@ -311,6 +532,24 @@ class DocFileReader(StructuredTextReader):
     def _source_text(self, lang):
         return self._read_file(self._id, lang=lang, ext=self._ext)
 
+    def _source_file(self, lang):
+        return self._input_file(self._id, lang=lang, ext=self._ext)
+
+    def _read_task(self, lang):
+        if type(self) not in (DocFileReader, DocDirReader):
+            # Derived classes may read the document differently.
+            return None
+        kwargs = dict(id=self._id, dir=self._dir, encoding=self._encoding, ext=self._ext,
+                      cache_dir=self._cache_dir)
+        return kwargs, lang
+
+    def _prefetched_document(self, lang):
+        document = super(DocFileReader, self)._prefetched_document(lang)
+        if document is not None:
+            # Error reports rely on the name of the last file read.
+            self._source_filename = self._input_file(self._id, lang=lang, ext=self._ext)
+        return document
+
 
 class DocDirReader(DocFileReader):
     """Node of a Structured Text read from a source file.
@@ -354,6 +593,18 @@ class DocDirReader(DocFileReader):
         return children
 
 
+def _read_document(task):
+    # Read and parse one document in a worker process (see 'Reader._read_parallel()').
+    kwargs, lang = task
+    reader = DocFileReader(**kwargs)
+    try:
+        return reader._document(reader._source_text(lang), filename=reader._source_file(lang))
+    except Exception:
+        # The document is read again by the parent process to report the error exactly the
+        # same way as in serial mode.
+        return None
+
+
 def reader(dir, name, root=True, encoding=None, ext='txt', parent=None, recourse=True, cls=None,
            **kwargs):
     """Create an instance of sensible reader class for given source directory and document name.
@@ -25,10 +25,13 @@ from future import standard_library
 from builtins import zip
 from builtins import range
 
+import contextlib
 import datetime
 import io
 import os
+import pickle
 import re
+import shutil
 import string
 import sys
 import unittest
@@ -63,6 +66,32 @@ if sys.version_info[0] > 2:
     basestring = str
 
 
+@contextlib.contextmanager
+def temporary_directory():
+    """Return a context manager creating a temporary directory removed on exit."""
+    directory = tempfile.mkdtemp()
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory)
+
+
+def write_file(filename, text):
+    """Write given unicode 'text' into given file."""
+    with io.open(filename, 'w') as f:
+        f.write(text)
+
+
+def read_files(directory):
+    """Return a dictionary of contents of all files in 'directory' by relative paths."""
+    files = {}
+    for path, dirs, filenames in os.walk(directory):
+        for filename in filenames:
+            with open(os.path.join(path, filename), 'rb') as f:
+                files[os.path.relpath(os.path.join(path, filename), directory)] = f.read()
+    return files
+
+
 class TranslatableText(unittest.TestCase):
 
     def test_interpolation(self):
@@ -107,6 +136,49 @@ class TranslatableText(unittest.TestCase):
         c = lcg.concat('a', ('b', 'c', 'd'), 'e', 'f', separator='-')
         assert isinstance(c, unistr)
         assert c == 'a-b-c-d-e-f'
+        d = lcg.TranslatableText("x")
+        for i in range(2000):
+            d = lcg.concat('(', d, ')', lcg.TranslatableText("y"))
+        assert len(d.items()) == 4002
+        assert d == 2000 * '(' + 'x' + 2000 * ')y'
+        assert lcg.Localizer().localize(d) == d
+
+    def test_localize_chunks(self):
+        loc = lcg.Localizer()
+        a = lcg.concat('a', ('b', lcg.TranslatableText("c")), 'd', separator='-')
+        for text in (a, a.upper(), lcg.concat(a, a).replace('-', '+'), 'x', ''):
+            chunks = list(loc.localize_chunks(text, chunk_size=2))
+            assert ''.join(chunks) == loc.localize(text), (text, chunks)
+        assert list(loc.localize_chunks(a, chunk_size=2)) == ["a-", "b-", "c-", "d"]
+        assert list(loc.localize_chunks('abcde', chunk_size=2)) == ["ab", "cd", "e"]
+        assert list(loc.localize_chunks(b'abcde', chunk_size=2)) == [b"ab", b"cd", b"e"]
+        g = lcg.HtmlGenerator()
+        b = g.div((g.span(lcg.TranslatableText("<x>")), "a & b"), id='x')
+        assert ''.join(loc.localize_chunks(b, chunk_size=1)) == loc.localize(b) == \
+            '<div id="x"><span>&lt;x&gt;</span>a &amp; b</div>'
+
+    def test_rope(self):
+        loc = lcg.Localizer()
+        g = lcg.HtmlGenerator(rope_size=10)
+        assert g.span('x') == '<span>x</span>'
+        a = g.div((g.span(lcg.TranslatableText("<x>")), "a & b"))
+        assert isinstance(a, lcg.Rope)
+        b = g.p((a, 'c < d', a))
+        c = lcg.concat('<', b)
+        assert isinstance(b, lcg.Rope) and isinstance(c, lcg.Rope)
+        html = ('<p><div><span>&lt;x&gt;</span>a &amp; b</div>c &lt; d'
+                '<div><span>&lt;x&gt;</span>a &amp; b</div></p>')
+        assert b == html
+        assert len(b) == len(html)
+        assert b.startswith('<p>')
+        assert 'x' + c == 'x<' + html
+        assert loc.localize(b) == lcg.concat(b).localize(loc) == html
+        assert isinstance(loc.localize(b), lcg.HtmlEscapedUnicode)
+        assert ''.join(loc.localize_chunks(c, chunk_size=3)) == loc.localize(c) == '&lt;' + html
+        d = g.div('y' * 20)
+        assert isinstance(d, lcg.Rope)
+        assert isinstance(d.concat(), lcg.HtmlEscapedUnicode)
+        assert d.concat() == loc.localize(d) == '<div>' + 'y' * 20 + '</div>'
 
     def test_replace(self):
         t = lcg.TranslatableText("Version %s", "xox")
@@ -155,12 +227,81 @@ class TranslatableText(unittest.TestCase):
         assert str(tag) == '<tag attr="Bob + Joe">'
         assert tag.localize(cs) == '<tag attr="Bobik + Pepa">'
 
+    def test_localization_cache(self):
+        loc = lcg.Localizer()
+        _ = lcg.TranslatableTextFactory('test')
+        assert loc.localize(_("Page %d", 3)) is loc.localize(_("Page %d", 3))
+        assert loc.localize(_("Page %d", 3)) is not loc.localize(_("Page %d", 4))
+        # Localizable arguments are only equal as strings, so they are not cached.
+        assert loc.localize(_("See %s", _("x"))) is not loc.localize(_("See %s", _("x")))
+        x = _("x %s", 'y')
+        assert loc.localize(x.transform(lambda x: x.upper())) == 'X Y'
+        assert loc.localize(x) == 'x y'
+        # Equal values of different types must not share the cached result.
+        assert [loc.localize(_('value: %s', v)) for v in (1, True, 1.0)] == \
+            ['value: 1', 'value: True', 'value: 1.0']
+        assert [loc.localize(_('value: %(v)s', v=v)) for v in (1, True, 1.0)] == \
+            ['value: 1', 'value: True', 'value: 1.0']
+        loc = lcg.Localizer(cache_size=0)
+        assert loc.localize(_("Page %d", 3)) is not loc.localize(_("Page %d", 3))
+
     def test_pgettext(self):
         cs = lcg.Localizer('cs', translation_path=translation_path)
         assert _.pgettext('dont translete this msg', 'untranslated').localize(cs) == 'untranslated'
         assert _.pgettext('verb', 'force').localize(cs) == 'donutit'
         assert _.pgettext('noun', 'force').localize(cs) == 'síla'
 
+    def test_mapped_translations(self):
+        import struct
+        messages = {
+            '': 'Content-Type: text/plain; charset=UTF-8\n'
+                'Plural-Forms: nplurals=3; plural=(n==1) ? 0 : (n>=2 && n<=4) ? 1 : 2;\n',
+            'verb\x04force': 'donutit',
+            'noun\x04force': 'síla',
+            '%d file\x00%d files': '%d soubor\x00%d soubory\x00%d souborů',
+            'menu\x04%d item\x00%d items': '%d položka\x00%d položky\x00%d položek',
+        }
+        keys = sorted(messages)
+        ids = [k.encode('utf-8') for k in keys]
+        strs = [messages[k].encode('utf-8') for k in keys]
+        offset = 28 + 16 * len(keys)
+        table = []
+        for s in ids + strs:
+            table.append((len(s), offset))
+            offset += len(s) + 1
+        with temporary_directory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, 'cs', 'LC_MESSAGES'))
+            with open(os.path.join(tmpdir, 'cs', 'LC_MESSAGES', 'x.mo'), 'wb') as f:
+                f.write(struct.pack('<7I', 0x950412de, 0, len(keys), 28,
+                                    28 + 8 * len(keys), 0, 0))
+                f.write(b''.join(struct.pack('<2I', *x) for x in table))
+                f.write(b''.join(s + b'\0' for s in ids + strs))
+            catalog_dir = os.path.join(tmpdir, 'catalogs')
+            t = lcg.GettextTranslator('cs', path=(tmpdir,), default_domain='x',
+                                      catalog_dir=catalog_dir)
+            assert t.gettext('noun\x04force') == 'síla'
+            assert t.gettext('verb\x04force') == 'donutit'
+            assert t.gettext('untranslated') == 'untranslated'
+            assert [t.ngettext('%d file', '%d files', n) for n in (1, 3, 5)] == \
+                ['%d soubor', '%d soubory', '%d souborů']
+            assert t.ngettext('%d dir', '%d dirs', 1) == '%d dir'
+            assert sorted(t.messages()) == ['%d file', 'menu\x04%d item', 'noun\x04force',
+                                            'verb\x04force']
+            assert len(os.listdir(catalog_dir)) == 1
+            m = lcg.MappedTranslations(os.path.join(catalog_dir, os.listdir(catalog_dir)[0]))
+            for i in range(2):
+                # The second round is served from the cache of found translations.
+                assert m.gettext('noun\x04force') == m.pgettext('noun', 'force') == 'síla'
+                assert m.pgettext('verb', 'force') == 'donutit'
+                assert m.pgettext('noun', 'untranslated') == 'untranslated'
+                assert [m.npgettext('menu', '%d item', '%d items', n) for n in (1, 3, 5)] == \
+                    ['%d položka', '%d položky', '%d položek']
+                assert m.npgettext('noun', '%d item', '%d items', 5) == '%d items'
+            loc = lcg.Localizer('cs', translation_path=(tmpdir,), catalog_dir=catalog_dir)
+            _x = lcg.TranslatableTextFactory('x')
+            assert loc.localize(_x.pgettext('noun', 'force')) == 'síla'
+            assert loc.localize(_x.ngettext('%d file', '%d files', 2)) == '2 soubory'
+
     def test_string_context(self):
         a = lcg.TranslatableText("Version %s", "1.0")
         assert a == "Version 1.0"
@@ -467,6 +608,19 @@ class ContentNode(unittest.TestCase):
         assert a.linear() == [a, b, c, d]
         assert b.linear() == [b]
         assert c.linear() == [c, d]
+        assert d.next() is None
+        assert a.prev() is None
+        assert d.position() == 3
+        assert a.find_node('d') is d
+        assert c.find_node('b') is None
+        assert a.find_node('x') is None
+        # The index is rebuilt when the tree becomes a part of a bigger tree.
+        e = lcg.ContentNode('e')
+        root = lcg.ContentNode('root', children=(e, a))
+        assert d.position() == 5
+        assert a.prev() is e
+        assert root.linear() == [root, e, a, b, c, d]
+        assert root.find_node('c') is c
 
     def test_variants(self):
         n = lcg.ContentNode(
@@ -512,6 +666,98 @@ class ContentNode(unittest.TestCase):
         assert n.resources() == (img,)
 
 
+class Reader(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._tmpdir)
+
+    def test_parse_cache(self):
+        srcdir = os.path.join(self._tmpdir, 'src')
+        cache_dir = os.path.join(self._tmpdir, 'cache')
+        os.mkdir(srcdir)
+
+        def build(parse=True):
+            reader = lcg.reader(srcdir, 'index', cache_dir=cache_dir)
+            if not parse:
+                reader._parser = None
+            node = reader.build()
+            paragraph = node.content().content()[0].content()[0]
+            return node.title(), paragraph.content()[0].content()[0].text()
+        filename = os.path.join(srcdir, 'index.txt')
+        write_file(filename, '= Title =\n\nHello\n')
+        assert build() == ('Title', 'Hello')
+        assert len(os.listdir(cache_dir)) == 1
+        # Unchanged source is not parsed again.
+        assert build(parse=False) == ('Title', 'Hello')
+        write_file(filename, '= Another Title =\n\nHello world\n')
+        assert build() == ('Another Title', 'Hello world')
+        assert len(os.listdir(cache_dir)) == 1
+        # Each language variant read by one reader is cached separately.
+        os.remove(filename)
+        for lang in ('cs', 'en'):
+            write_file(os.path.join(srcdir, 'index.%s.txt' % lang), '= Title %s =\n\nx\n' % lang)
+        for parse in (True, False):
+            reader = lcg.reader(srcdir, 'index', cache_dir=cache_dir)
+            if not parse:
+                reader._parser = None
+            node = reader.build()
+            assert [lcg.Localizer(lang).localize(node.title()) for lang in ('cs', 'en')] == \
+                ['Title cs', 'Title en']
+        assert len(os.listdir(cache_dir)) == 3
+
+    def test_parallel_read(self):
+        tmpdir = self._tmpdir
+
+        def build(jobs):
+            node = lcg.reader(tmpdir, 'index', jobs=jobs).build()
+            return [(n.id(), n.hidden(), n.title()) for n in node.linear()]
+        write_file(os.path.join(tmpdir, '_index.txt'), 'index\nb\na\n')
+        for name in ('index', 'a', 'b', 'c'):
+            write_file(os.path.join(tmpdir, name + '.txt'),
+                       '= Title %s =\n\nText %s\n' % (name, name))
+        assert build(2) == build(None) == [('index', False, 'Title index'),
+                                           ('b', False, 'Title b'),
+                                           ('a', False, 'Title a'),
+                                           ('c', True, 'Title c')]
+        write_file(os.path.join(tmpdir, 'b.txt'), 'No section\n')
+        errors = []
+        for jobs in (None, 2):
+            try:
+                build(jobs)
+            except Exception as e:
+                errors.append(e._lcg_processing_details)
+        assert len(errors) == 2 and errors[0] == errors[1]
+        assert errors[0][0] == ('File', os.path.join(tmpdir, 'b.txt'))
+
+    def test_lazy_variants(self):
+        tmpdir = self._tmpdir
+        for name in ('index', 'a'):
+            for lang in ('en', 'cs'):
+                write_file(os.path.join(tmpdir, name + '.' + lang + '.txt'),
+                           '= %s %s =\n\nText\n' % (name, lang))
+        node = lcg.reader(tmpdir, 'index', lazy=True).build()
+        child = node.children()[0]
+        variants = [n._variants_dict[lang] for n in (node, child) for lang in ('en', 'cs')]
+        assert not any(v.loaded() for v in variants)
+        localizer = lcg.Localizer('cs')
+        assert localizer.localize(child.title()) == 'a cs'
+        assert child.content('cs').parent() is child
+        assert [v.loaded() for v in variants] == [False, False, False, True]
+        assert localizer.localize(node.title()) == 'index cs'
+        assert lcg.Localizer('en').localize(node.title()) == 'index en'
+        # Errors reading a variant are distinguished from other I/O errors.
+        os.remove(os.path.join(tmpdir, 'a.en.txt'))
+        for read in (lambda: lcg.Localizer('en').localize(child.title()),
+                     lambda: child.content('en')):
+            with pytest.raises(lcg.VariantReadError) as e:
+                read()
+            assert isinstance(e.value, IOError)
+            assert 'a.en.txt' in str(e.value)
+
+
 class Resources(unittest.TestCase):
 
     def test_subclass(self):
@@ -556,6 +802,87 @@ class Resources(unittest.TestCase):
         assert tuple(r.filename() for r in b.resources()) == ('sound1.ogg', 'sound2.mp3')
 
 
+class Note(lcg.TextContent):
+    # Derived class without __slots__ storing an additional attribute.
+
+    def __init__(self, text, author, **kwargs):
+        self.author = author
+        super(Note, self).__init__(text, **kwargs)
+
+
+class Content(unittest.TestCase):
+
+    def test_pickle(self):
+        content = lcg.Container((
+            lcg.Parser().parse('= A =\n\nfoo *bar* [http://www.example.com baz]\n')[0],
+            Note('text', 'me', lang='cs'),
+        ))
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            section, note = pickle.loads(pickle.dumps(content, protocol)).content()
+            assert section.title() == 'A'
+            assert section.heading().level() == 2
+            paragraph = section.content()[0].content()[0]
+            assert paragraph.container().container() is section
+            assert [c.__class__ for c in paragraph.content()[0].content()] == \
+                [lcg.TextContent, lcg.Strong, lcg.TextContent, lcg.Link]
+            assert note.text() == 'text' and note.author == 'me' and note.lang() == 'cs'
+        assert not hasattr(section, '__dict__')
+        clone = note.clone('other')
+        assert clone.text() == 'other' and clone.author == 'me'
+
+    def test_siblings(self):
+        a, b, c, d = [lcg.TextContent(x) for x in 'abcd']
+        strong = lcg.Strong((b, c))
+        paragraph = lcg.Paragraph((a, strong, d))
+        assert list(strong.preceding_siblings()) == [a]
+        assert list(strong.following_siblings()) == [d]
+        assert list(d.preceding_siblings()) == [strong, a]
+        assert list(paragraph.following_siblings()) == []
+        assert c.previous_element() is b
+        assert b.previous_element() is a
+        assert c.next_element() is d
+        assert d.next_element() is None
+        assert b.previous_element(stop_classes=(lcg.Strong,)) is None
+
+    def test_intern_text(self):
+        _ = lcg.TranslatableTextFactory('test')
+        a, b, c, d = [lcg.coerce(x) for x in ('foo', ''.join(('f', 'oo')), _("foo"), _("foo"))]
+        assert a is not b and a.text() is b.text()
+        assert c.text() is d.text() and c.text() is not a.text()
+        assert isinstance(c.text(), lcg.TranslatableText)
+        assert lcg.coerce(_("foo %s", 'x')).text() is not lcg.coerce(_("foo %s", 'y')).text()
+        loc = lcg.Localizer()
+        assert [loc.localize(lcg.coerce(_("n: %s", v)).text()) for v in (1, True, 1.0)] == \
+            ['n: 1', 'n: True', 'n: 1.0']
+        items = lcg.join(('x', 'y', 'z'), ', ').content()
+        assert items[1] is not items[3] and items[1].text() is items[3].text()
+        # The parser interns the texts, but the elements are left as they are.
+        parsed = lcg.Parser().parse_inline_markup('a -- b \\*c\\* *d*').content()
+        assert [c.text() for c in parsed[:-1]] == ['a ', '—', ' b ', '*', 'c', '*', ' ']
+        assert parsed[3].text() is parsed[5].text()
+
+    def test_section_index(self):
+        a = lcg.Section('A', lcg.Section('AA', lcg.p('x')))
+        b = lcg.Section('B', lcg.p('y'))
+        cell = lcg.Section('C', lcg.p('z'))
+        table = lcg.Table((lcg.TableRow((lcg.TableCell(cell),)),))
+        root = lcg.Container((a, table, b))
+        # Sections within tables are visible through sections() as well.
+        assert root.sections() == [a, cell, b]
+        assert [s.id() for s in (a, a.sections()[0], cell, b)] == \
+            ['sec1', 'sec1.1', 'sec2', 'sec3']
+        assert a.sections()[0].heading().level() == 3
+
+        class Hidden(lcg.Container):
+            def sections(self):
+                return []
+        a = lcg.Section('A', lcg.Section('AA', lcg.p('x')))
+        b = lcg.Section('B', lcg.p('y'))
+        root = lcg.Container((Hidden(a), b))
+        assert root.sections() == [b]
+        assert b.id() == 'sec1' and len(a.sections()) == 1
+
+
 class Parser(unittest.TestCase):
 
     def setUp(self):
@@ -728,6 +1055,133 @@ blah blah
         assert item_content[1].order() == lcg.ItemizedList.LOWER_ALPHA
         assert len(item_content[1].content()) == 2
 
+    def test_style(self):
+        text = '''
+blah
+
+@style special
+styled
+
+* item
+@end style
+
+blah
+'''
+        self._test_parser(text, (
+            lcg.p("blah"),
+            lcg.Container((lcg.p("styled"), lcg.ul(("item",))), name='special'),
+            lcg.p("blah"),
+        ))
+
+    def test_comments(self):
+        text = '# comment\n\tfoo\n# comment\n\n\tbar\n#\n'
+        self._test_parser(text, (
+            lcg.p("foo"),
+            lcg.p("bar"),
+        ))
+
+    def test_error_line(self):
+        class Parser(lcg.Parser):
+            def _hrule_processor(self, text, position, **kwargs):
+                if super(Parser, self)._hrule_processor(text, position, **kwargs):
+                    raise lcg.ProcessingError("Rule not allowed")
+        text = '''# comment
+= Title =
+# comment
+
+blah
+
+>>
+blah
+
+# comment
+----
+<<
+'''
+        with pytest.raises(lcg.ProcessingError) as e:
+            Parser().parse(text)
+        assert e.value.info() == [('Line', '11')]
+        text = '''# comment
+= Title =
+
+blah
+
+@style special
+# comment
+styled
+
+----
+@end style
+'''
+        with pytest.raises(lcg.ProcessingError) as e:
+            Parser().parse(text)
+        assert e.value.info() == [('Line', '10')]
+
+    def test_statistics(self):
+        assert self._parser.statistics() is None
+        parser = lcg.Parser(statistics=True)
+        parser.parse('= Title =\n\n| a | b |\n\n@center\nblah\n')
+        statistics = parser.statistics()
+        assert statistics['_section_processor'] == (1, 0)
+        assert statistics['_table_processor'] == (1, 0)
+        assert statistics['_alignment_processor'] == (1, 0)
+        assert statistics['_paragraph_processor'] == (1, 0)
+        # Processors which can't match the first character are not tried at all.
+        assert statistics['_toc_processor'] == (0, 2)
+        assert '_field_processor' not in statistics
+        assert '_hrule_processor' not in statistics
+
+    def test_section_ids(self):
+        text = ('= A =\n\n== B ==\n\nb\n\n== C ==\n\n=== D ===\n\nd\n\n'
+                '= E = e\n\n== F ==\n\nf\n')
+        content = lcg.Container(self._parser.parse(text))
+        a, e = content.sections()
+        b, c = a.sections()
+        d = c.sections()[0]
+        f = e.sections()[0]
+        assert [s.id() for s in (a, b, c, d, e, f)] == \
+            ['sec1', 'sec1.1', 'sec1.2', 'sec1.2.1', 'e', 'e.1']
+        assert [s.heading().level() for s in (a, b, c, d, e, f)] == [2, 3, 3, 4, 2, 3]
+        assert a.heading() is a.heading()
+        toc = lcg.TableOfContents(a)
+        lcg.Container((toc,))
+        assert toc.items('en') == [(b, []), (c, [(d, [])])]
+        # Wrapping the tree into another container updates the index.
+        wrapped = lcg.Container((lcg.Section('X', ()), content))
+        assert [s.title() for s in wrapped.sections()] == ['X', 'A', 'E']
+        assert e.heading().level() == 2
+
+    def test_iterparse(self):
+        text = '@parameter header Header\n\nfoo\n\n----\n\nbar\n'
+        parameters = {}
+        blocks = self._parser.iterparse(io.StringIO(text), parameters)
+        assert isinstance(next(blocks), lcg.Paragraph)
+        assert 'presentation' not in parameters
+        # The parser may be used for other purposes in the meantime.
+        assert len(self._parser.parse('= A =\n\nx\n')) == 1
+        assert [c.__class__ for c in blocks] == [lcg.HorizontalSeparator, lcg.Paragraph]
+        assert isinstance(parameters['presentation'], lcg.Presentation)
+        assert 'page_header' in parameters
+        assert len(list(self._parser.iterparse(text))) == 3
+
+    def test_inline_cache(self):
+        assert self._parser.inline_cache_statistics() is None
+        parser = lcg.Parser(inline_cache_size=2)
+        c1 = parser.parse_inline_markup('a *b* c')
+        c2 = parser.parse_inline_markup('a *b* c')
+        assert c1 is not c2
+        assert c1.content()[1] is not c2.content()[1]
+        assert c2.content()[1].container() is c2
+        assert c2.content()[1].content()[0].container() is c2.content()[1]
+        assert c1.content()[1].content()[0].text() == c2.content()[1].content()[0].text() == 'b'
+        assert parser.inline_cache_statistics() == (1, 1, 1)
+        parser.parse_inline_markup('x')
+        parser.parse_inline_markup('y')
+        parser.parse_inline_markup('a *b* c')
+        assert parser.inline_cache_statistics() == (1, 4, 2)
+        parser.parse('| a | b |\n| a | b |\n')
+        assert parser.inline_cache_statistics() == (3, 6, 2)
+
     def test_paragraph_newline(self):
         c = self._parser.parse('hello\n\nworld')
         assert c[0].content()[0].content()[0].text()[-1] == 'o', \
@@ -941,9 +1395,84 @@ class MacroParser(unittest.TestCase):
     def test_inclusion(self):
         self._parse("Foo\n@include bar\nBaz\n", bar='Bar') == "Foo\nBar\nBaz\n"
 
+    def test_template(self):
+        template = lcg.MacroParser(globals=dict(x=1)).compile("A\n@if x > 1\nX\n@endif\nB\n")
+        assert template.render() == "A\nB\n"
+        assert template.render(dict(x=2)) == "A\nX\nB\n"
+        template = lcg.MacroParser().compile("@include foo\nB\n")
+        assert template.render(dict(foo='@if x\nX\n@endif', x=False)) == "B\n"
+        assert template.render(dict(foo='@if x\nX\n@endif', x=True)) == "X\nB\n"
+        assert template.render(dict(foo='F')) == "F\nB\n"
+
+    def test_default_method_override(self):
+        class Parser(lcg.MacroParser):
+            def _default_evaluate(self, expr):
+                return expr == 'yes' or super(Parser, self)._default_evaluate(expr)
+
+            def _default_include(self, name):
+                return super(Parser, self)._default_include(name).upper()
+        parser = Parser(globals=dict(x=True, foo='f'))
+        text = "@include foo\n@if yes\nY\n@endif\n@if x\nX\n@endif\n"
+        assert parser.parse(text) == "F\nY\nX\n"
+        template = parser.compile(text)
+        assert template.render(dict(x=False, foo='g')) == "G\nY\n"
+        # The constructor globals are in effect again after rendering.
+        assert parser.parse(text) == "F\nY\nX\n"
+
 
 class HtmlImport(unittest.TestCase):
 
+    def test_matchers(self):
+        import xml.etree.ElementTree
+        import lcg.transform
+
+        def linear_scan(matchers, element):
+            # Return the handler of the first matching rule (as tested before indexing).
+            for test, handler in matchers:
+                if callable(test):
+                    if test(element):
+                        return handler
+                    continue
+                if not isinstance(test, (tuple, list)):
+                    test = (test,)
+                if re.match(test[0] + '$', element.tag) and all(
+                        a in element.attrib and re.match(r, element.attrib[a] + '$')
+                        for a, r in test[1:]):
+                    return handler
+
+        def indexed(transformer, element):
+            for test, handler in transformer._tag_matchers.get(element.tag,
+                                                               transformer._fallback_matchers):
+                if test(element):
+                    return handler[0]
+
+        class Transformer(lcg.transform.Processor.Transformer):
+            def _matchers(self):
+                return (
+                    (lambda e: e.get('class') == 'first', 'first'),
+                    ('d.*', 'd-regexp'),
+                    ('a', 'a'),
+                    (('(b|c)', ('class', 'x')), 'b-or-c-with-x'),
+                    (lambda e: e.tag == 'a', 'never'),
+                    ('div', 'div-after-regexp'),
+                    ('(b|span)', 'b-or-span'),
+                    (lambda e: e.tag.startswith('x'), 'x-function'),
+                    ('x-y', 'x-y'),
+                    ('.*', 'any'),
+                )
+        tags = ('a', 'b', 'c', 'div', 'dl', 'span', 'x-y', 'x-z', 'p', 'table', 'unknown')
+        attributes = ({}, {'class': 'x'}, {'class': 'first'},
+                      {'style': 'page-break-after: always;'})
+        for transformer in (Transformer(), lcg.HTMLProcessor._Transformer()):
+            for tag in tags:
+                for attr in attributes:
+                    element = xml.etree.ElementTree.Element(tag, attr)
+                    expected = linear_scan(transformer._matchers(), element)
+                    if isinstance(expected, (tuple, list)):
+                        expected = expected[0]
+                    assert indexed(transformer, element) == expected, (tag, attr)
+        assert 'unknown' not in Transformer()._tag_matchers
+
     def test_html(self):
         # This HTML preserves the formatting produced by ckeditor, only long lines are wrapped
         # in order to make Flycheck happy...
@@ -1206,6 +1735,92 @@ class HtmlExport(unittest.TestCase):
         ):
             assert lcg.coerce(content).export(context) == html
 
+    def test_export_element(self):
+        n = lcg.ContentNode('test', title='Test', content=lcg.Content())
+        exporter = lcg.HtmlExporter()
+        context = exporter.context(n, None)
+        # Classes not defined in _define_export_methods() use their base class' method.
+        assert Note not in exporter._define_export_methods()
+        for i in range(2):
+            assert exporter.export_element(context, Note('a < b', author='x')) == 'a &lt; b'
+        assert exporter._resolved_export_method[Note] == exporter._export_text_content
+        c = lcg.Container(lcg.p(lcg.strong('x')))
+        assert c.export(context) == '<p><strong>x</strong></p>'
+        text = c.content()[0].content()[0].content()[0]
+        assert text.parent() is n
+        # Only the element without a parent gets it, the descendants follow it.
+        m = lcg.ContentNode('m', title='M', content=lcg.Content())
+        c.set_parent(m)
+        assert text.parent() is m
+
+    def test_export_rope(self):
+        class Exporter(lcg.HtmlExporter):
+            _ROPE_SIZE = None
+        _ = lcg.TranslatableTextFactory('test')
+
+        def section(depth):
+            content = [lcg.p(_("Note:"), ' <a> & ' * 100, lcg.strong('%d/%d' % (depth, i)))
+                       for i in range(10)]
+            if depth > 1:
+                content.append(section(depth - 1))
+            return lcg.Section(_("Level %d", depth), lcg.Container(content), id='s%d' % depth)
+        node = lcg.ContentNode('test', title='Test', content=section(5))
+        result = []
+        for exporter in (lcg.HtmlExporter(), Exporter()):
+            context = exporter.context(node, None)
+            exported = exporter.export(context)
+            result.append((exported.__class__, context.localize(exported)))
+        assert result[0] == result[1]
+        # The file exporter writes the rope out without joining it.
+        exporter = lcg.HtmlFileExporter()
+        assert isinstance(exporter._dump_output(exporter.context(node, None)), lcg.Rope)
+        with temporary_directory() as directory:
+            exporter.dump(node, directory)
+            assert read_files(directory) == {'test.html': result[0][1].encode('utf-8')}
+
+    def test_dump_parallel(self):
+        style = lcg.Stylesheet('x.css', content=b'p {}')
+
+        def node(id, children=()):
+            return lcg.ContentNode(id, title=id, children=children, content=lcg.Container(
+                lcg.p('Text of ' + id), resources=(style,),
+            ), resource_provider=provider)
+
+        class Exporter(lcg.HtmlStaticExporter):
+            def _document(self, context):
+                lcg.log("Exporting %s", context.node().id())
+                context.log("Exported " + context.node().id(), kind=lcg.WARNING)
+                return super(Exporter, self)._document(context)
+        result = []
+        for jobs in (None, 3):
+            # Each export gets a new provider, as it remembers the resources.
+            provider = lcg.ResourceProvider()
+            root = node('index', [node('a', [node('b')]), node('c')])
+            with temporary_directory() as directory:
+                exporter = Exporter(styles=('x.css', 'missing.css'))
+                stderr = sys.stderr
+                sys.stderr = io.StringIO()
+                try:
+                    exporter.dump(root, directory, jobs=jobs)
+                    output = sys.stderr.getvalue()
+                finally:
+                    sys.stderr = stderr
+                result.append((read_files(directory), output))
+        assert sorted(result[0][0].keys()) == sorted(result[1][0].keys()) == [
+            'a.html', 'b.html', 'c.html', 'css/x.css', 'index.html',
+        ]
+        assert result[0][0] == result[1][0]
+        # The output is logged in the order of nodes and in parallel export the
+        # missing resource is not reported again by each worker (the resources
+        # themselves are only exported at the end).
+        for files, output in result:
+            assert output.count('missing.css') == 1
+            assert [line.split(':')[0].strip() for line in output.splitlines()
+                    if not line.endswith('file created.')] == [
+                'Exporting index', 'WARNING', 'WARNING', 'Exporting a', 'WARNING',
+                'Exporting b', 'WARNING', 'Exporting c', 'WARNING',
+            ]
+
     def test_formatting(self):
         resources = (lcg.Resource('text.txt', uri='/resources/texts/text.txt'),
                      lcg.Audio('xx.mp3'),
@@ -1381,6 +1996,105 @@ class HtmlExport(unittest.TestCase):
             assert value == json.loads(g.js_value(value))
 
 
+class TextExport(unittest.TestCase):
+
+    def test_toc_markers(self):
+        a = lcg.Section('A', lcg.p('x'))
+        b = lcg.Section('B', lcg.p('y'))
+        n = lcg.ContentNode('n', title='N', content=lcg.Container((
+            lcg.TableOfContents(title='Contents'), a, b,
+        )))
+        exporter = lcg.TextExporter()
+        context = exporter.context(n, None)
+        assert context.localize(exporter.export(context)) == \
+            'N\n\nContents\n\nA \nB \n\nA\n\nx\n\nB\n\ny\n\n'
+        assert context.is_toc_element(a) and context.is_toc_element(b)
+        assert not context.is_toc_element(lcg.Section('A', lcg.p('x')))
+        # Sections get a marker in _export_section() and another one as TOC elements.
+        assert [context.toc_element(str(i)) for i in range(4)] == [a, a, b, b]
+        # Markers written to the output remain valid when the TOC elements change.
+        context.set_toc_elements(())
+        assert context.toc_element('3') is b and not context.is_toc_element(b)
+        # The deprecated attribute still works for registering the elements.
+        context = exporter.context(n, None)
+        context.toc_elements.append(a)
+        assert context.is_toc_element(a) and not context.is_toc_element(b)
+        elements = context.toc_elements = []
+        elements.append(b)
+        assert context.is_toc_element(b) and not context.is_toc_element(a)
+        assert context.toc_elements == [b]
+        context.set_toc_elements((a,))
+        assert context.is_toc_element(a) and not context.is_toc_element(b)
+
+    def test_dump_variants(self):
+        n = lcg.ContentNode('n', title='N', variants=[
+            lcg.Variant(lang, content=lcg.p('Text ' + lang)) for lang in ('cs', 'de', 'en')
+        ])
+        for jobs in (None, 2):
+            with temporary_directory() as directory:
+                lcg.TextExporter().dump(n, directory, jobs=jobs)
+                files = read_files(directory)
+                assert sorted(files) == ['n.cs.text', 'n.de.text', 'n.en.text']
+                assert files['n.de.text'] == b'N\n\nText de\n\n'
+        # All variants written into one file are exported serially (the last
+        # one is left in the file).
+        for exporter in (lcg.TextExporter(), lcg.HtmlFileExporter()):
+            result = []
+            for jobs in (None, 2):
+                with temporary_directory() as directory:
+                    exporter.dump(n, directory, filename='x', jobs=jobs)
+                    result.append(read_files(directory))
+            assert list(result[0]) == ['x']
+            assert b'Text en' in result[0]['x']
+            assert result[0] == result[1]
+
+    def test_skip_unchanged(self):
+        with temporary_directory() as directory:
+            a, b = [os.path.join(directory, 'n.%s.text' % lang) for lang in ('cs', 'en')]
+            n = lcg.ContentNode('n', title='N', variants=[
+                lcg.Variant('cs', content=lcg.p('Text')),
+                lcg.Variant('en', content=lcg.p('Text')),
+            ])
+            exporter = lcg.TextExporter(skip_unchanged=True)
+            exporter.dump(n, directory)
+            assert exporter.changed_files() == [a, b]
+            os.utime(a, (0, 0))
+            os.utime(b, (0, 0))
+            n = lcg.ContentNode('n', title='N', variants=[
+                lcg.Variant('cs', content=lcg.p('Text')),
+                lcg.Variant('en', content=lcg.p('Changed text')),
+            ])
+            exporter = lcg.TextExporter(skip_unchanged=True)
+            exporter.dump(n, directory, jobs=2)
+            assert exporter.changed_files() == [b]
+            assert os.path.getmtime(a) == 0 and os.path.getmtime(b) != 0
+            with open(b) as f:
+                assert f.read() == 'N\n\nChanged text\n\n'
+            assert sorted(os.listdir(directory)) == ['n.cs.text', 'n.en.text']
+
+    def test_failed_dump(self):
+        class Failing(lcg.TranslatableText):
+            def _localize(self, localizer):
+                raise Exception("Localization failed")
+
+        class Exporter(lcg.TextExporter):
+            def export(self, context, **kwargs):
+                # The output is localized gradually while it is written.
+                return lcg.concat(('x' * 100000, self._text))
+        with temporary_directory() as directory:
+            write_file(os.path.join(directory, 'n.text'), 'Previous output')
+            n = lcg.ContentNode('n', title='N', content=lcg.p('Text'))
+            exporter = Exporter()
+            exporter._text = Failing('y')
+            with pytest.raises(Exception):
+                exporter.dump(n, directory)
+            # The previous output is left intact and no temporary file remains.
+            assert read_files(directory) == {'n.text': b'Previous output'}
+            exporter._text = 'y'
+            exporter.dump(n, directory)
+            assert read_files(directory) == {'n.text': b'x' * 100000 + b'y'}
+
+
 class EpubExport(unittest.TestCase):
 
     def test_export(self):
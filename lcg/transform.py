@@ -38,6 +38,74 @@ if sys.version_info[0] > 2:
     basestring = str
 
 
+_LITERAL_TAG_MATCHER = re.compile(r'^(?:([\w-]+)|\(([\w-]+(?:\|[\w-]+)*)\))$')
+"""Matches TAG-REGEXP consisting only of literal tag names (see 'index_matchers()')."""
+
+
+def index_matchers(matchers):
+    """Return the matchers of a transformer indexed by tag names.
+
+    Arguments:
+
+      matchers -- sequence of transformation rules as returned by the
+        transformer's '_matchers()' method (see 'Processor.Transformer').
+
+    Returns the pair (TAG_MATCHERS, FALLBACK_MATCHERS).  TAG_MATCHERS is a
+    dictionary of lists of pairs (TEST_FUNCTION, (FUNCTION, KWARGS)) keyed by
+    tag names and FALLBACK_MATCHERS is the list of such pairs for the tags not
+    present in the dictionary.  Each element thus only needs to be tested
+    against the matchers which may match its tag, while the first matching
+    rule is the same as when testing all the rules in the order of definition.
+    Rules given by literal tag names (such as 'p' or '(ul|ol)') are only
+    included for those tags, rules with tag regexps and test functions are
+    included for all tags.
+
+    """
+    tag_matchers = {}
+    fallback_matchers = []
+    for test, handler in matchers:
+        tags = None
+        if isinstance(test, basestring):
+            test = (test,)
+        if isinstance(test, (tuple, list)):
+            attr_tests = [(a, re.compile(r),) for a, r in test[1:]]
+            match = _LITERAL_TAG_MATCHER.match(test[0])
+            if match:
+                tags = (match.group(1) or match.group(2)).split('|')
+                tag_regexp = None
+            else:
+                tag_regexp = re.compile(test[0] + '$')
+
+            def test_function(element, tag_regexp=tag_regexp, attr_tests=attr_tests):
+                if tag_regexp and not tag_regexp.match(element.tag):
+                    return False
+                for attr, regexp in attr_tests:
+                    try:
+                        value = element.attrib[attr]
+                    except KeyError:
+                        return False
+                    if not regexp.match(value + '$'):
+                        return False
+                return True
+        elif callable(test):
+            test_function = test
+        else:
+            raise Exception("Invalid matcher test specification", test)
+        if not isinstance(handler, (tuple, list)):
+            handler = (handler, {})
+        matcher = (test_function, handler)
+        if tags is None:
+            fallback_matchers.append(matcher)
+            for tag_specific_matchers in tag_matchers.values():
+                tag_specific_matchers.append(matcher)
+        else:
+            for tag in tags:
+                if tag not in tag_matchers:
+                    tag_matchers[tag] = list(fallback_matchers)
+                tag_matchers[tag].append(matcher)
+    return tag_matchers, fallback_matchers
+
+
 class Processor(object):
     """Common markup language parser and tree structure transformer.
 
@@ -124,34 +192,7 @@ class Processor(object):
             return ()
 
         def _make_matchers(self):
-            matchers = self._matchers()
-            compiled_matchers = []
-            for test, handler in matchers:
-                if isinstance(test, basestring):
-                    test = (test,)
-                if isinstance(test, (tuple, list)):
-                    tag_regexp = re.compile(test[0] + '$')
-                    attr_tests = [(a, re.compile(r),) for a, r in test[1:]]
-
-                    def test_function(element, tag_regexp=tag_regexp, attr_tests=attr_tests):
-                        if not tag_regexp.match(element.tag):
-                            return False
-                        for attr, regexp in attr_tests:
-                            try:
-                                value = element.attrib[attr]
-                            except KeyError:
-                                return False
-                            if not regexp.match(value + '$'):
-                                return False
-                        return True
-                elif callable(test):
-                    test_function = test
-                else:
-                    raise Exception("Invalid matcher test specification", test)
-                if not isinstance(handler, (tuple, list)):
-                    handler = (handler, {})
-                compiled_matchers.append((test_function, handler))
-            self._compiled_matchers = compiled_matchers
+            self._tag_matchers, self._fallback_matchers = index_matchers(self._matchers())
 
         def _make_content(self, tag, attributes, children, text=None):
             """Make and return new 'xml.etree.ElementTree.Element'.
@@ -199,7 +240,7 @@ class Processor(object):
             """
             if _followers is None:
                 _followers = []
-            for test, handler in self._compiled_matchers:
+            for test, handler in self._tag_matchers.get(element.tag, self._fallback_matchers):
                 if test(element):
                     function, kwargs = handler
                     return function(element, _followers, **kwargs)
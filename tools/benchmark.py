@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2026 Tomáš Cerha <cerha@truecode.cz>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Performance regression benchmarks.
+
+The benchmarks are not a part of the test suite as they take too long and
+their results depend on the machine.  Run them by hand before and after a
+change which may affect performance and compare the reported numbers.
+
+Usage: benchmark.py [NAME ...]
+
+Runs the named benchmarks or all of them when no name is given.
+
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import lcg  # noqa: E402
+
+BENCHMARKS = []
+
+
+def benchmark(function):
+    """Register 'function' as a benchmark named by the function name."""
+    BENCHMARKS.append(function)
+    return function
+
+
+def structured_text(size):
+    """Return a generated structured text document of roughly 'size' characters."""
+    chunk = '\n'.join((
+        "== Section %d ==",
+        "",
+        "A paragraph with /emphasized/, *strong* and =code= text and a",
+        "[http://www.example.com link] spanning more lines.",
+        "",
+        "  * First item.",
+        "  * Second item with",
+        "    a continuation line.",
+        "    1. Nested item.",
+        "",
+        "| *Name* | *Value* |",
+        "| foo    |      1  |",
+        "| bar    |      2  |",
+        "",
+        ":Field: value",
+        "",
+        "Term",
+        "  Description of the term.",
+        "",
+        "-----",
+        "Literal text",
+        "-----",
+        "",
+        "",
+    ))
+    parts = ["= Benchmark =\n\n"]
+    length = len(parts[0])
+    i = 0
+    while length < size:
+        i += 1
+        part = chunk % i
+        parts.append(part)
+        length += len(part)
+    return ''.join(parts)
+
+
+def html_page(size):
+    """Return a generated CMS-like HTML page of roughly 'size' characters."""
+    chunk = ''.join((
+        '<h2>Section %d</h2>',
+        '<p>A paragraph with <em>emphasized</em>, <strong>strong</strong> and <u>underlined</u> ',
+        'text and a <a href="http://www.example.com">link</a>.<br/>Next line.</p>',
+        '<p style="text-align: center;">Centered <span>text</span>.</p>',
+        '<div><ul><li>First item.</li><li>Second <strong>item</strong>.</li></ul>',
+        '<ol style="list-style-type: lower-alpha;"><li>Alpha.</li><li>Beta.</li></ol></div>',
+        '<table><tr><th>Name</th><th>Value</th></tr>',
+        '<tr><td>foo</td><td style="text-align: right;">1</td></tr>',
+        '<tr><td>bar</td><td style="text-align: right;">2</td></tr></table>',
+        '<dl><dt>Term</dt><dd>Description of the term.</dd></dl>',
+        '<blockquote><p>Quoted text.</p></blockquote>',
+        '<pre>Preformatted text</pre><hr/>',
+    ))
+    parts = ['<html><h1>Benchmark</h1>']
+    length = len(parts[0])
+    i = 0
+    while length < size:
+        i += 1
+        part = chunk % i
+        parts.append(part)
+        length += len(part)
+    parts.append('</html>')
+    return ''.join(parts)
+
+
+def nested_content(size, depth=50):
+    """Return a content tree of roughly 'size' characters of text nested 'depth' levels deep.
+
+    Each level is a section with paragraphs containing translatable texts, so
+    the exported output is deeply nested.
+
+    """
+    _ = lcg.TranslatableTextFactory('lcg')
+    paragraph = "A paragraph of text with some <special> & characters in it. " * 10
+    count = max(1, size // len(paragraph) // depth)
+
+    def level(depth):
+        content = [lcg.Paragraph((lcg.TextContent(_("Note:")), lcg.TextContent(' ' + paragraph),
+                                  lcg.Strong(lcg.TextContent('%d/%d' % (depth, i)))))
+                   for i in range(count)]
+        if depth > 1:
+            content.append(level(depth - 1))
+        return lcg.Section(_("Level %d", depth), lcg.Container(content))
+    return level(depth)
+
+
+def timed(function, *args, **kwargs):
+    """Call 'function' and return the pair (RESULT, SECONDS)."""
+    start = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start
+
+
+@benchmark
+def parse():
+    """Structured text parsing time of 1 MB, 10 MB and 50 MB documents.
+
+    The time per megabyte should remain roughly constant as the parser is
+    supposed to run in linear time.
+
+    """
+    for megabytes in (1, 10, 50):
+        text = structured_text(megabytes * 1024 * 1024)
+        content, seconds = timed(lcg.Parser().parse, text)
+        print("%3d MB: %7.2f s (%.3f s/MB)" % (megabytes, seconds, seconds / megabytes))
+
+
+@benchmark
+def html_import():
+    """Import of 1 MB and 5 MB HTML pages through 'lcg.html2lcg()'."""
+    for megabytes in (1, 5):
+        html = html_page(megabytes * 1024 * 1024)
+        content, seconds = timed(lcg.html2lcg, html)
+        print("%3d MB: %7.2f s (%.3f s/MB)" % (megabytes, seconds, seconds / megabytes))
+
+
+@benchmark
+def html_export():
+    """Export of a 5 MB page through 'lcg.HtmlExporter' with content nested 1, 10 and 50 levels.
+
+    The export time should grow only slightly with the nesting depth.
+
+    """
+    for depth in (1, 10, 50):
+        content = nested_content(5 * 1024 * 1024, depth=depth)
+        node = lcg.ContentNode('benchmark', title="Benchmark", content=content)
+        exporter = lcg.HtmlExporter()
+        context = exporter.context(node, 'en')
+        result, seconds = timed(exporter.export, context)
+        output = context.localize(result)
+        print("depth %2d: %7.2f s (%.1f MB)" % (depth, seconds, len(output) / 1024.0 / 1024))
+
+
+@benchmark
+def dump():
+    """Memory used by exporting and writing a 20 MB page into a file.
+
+    The content tree is created in advance, so only the memory allocated by
+    'lcg.HtmlFileExporter.dump()' is reported.  The exported pieces of the
+    page are held in memory, but they are localized and written gradually
+    without joining them, so the peak should stay close to the size of the
+    output (rather than a multiple of it).
+
+    """
+    import shutil
+    import tempfile
+    content = nested_content(20 * 1024 * 1024, depth=10)
+    node = lcg.ContentNode('benchmark', title="Benchmark", content=content)
+    exporter = lcg.HtmlFileExporter()
+    directory = tempfile.mkdtemp()
+    try:
+        tracemalloc.start()
+        result, seconds = timed(exporter.dump, node, directory)
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        output = os.path.getsize(os.path.join(directory, 'benchmark.html'))
+    finally:
+        shutil.rmtree(directory)
+    print("%7.2f s, output %.1f MB, peak %.1f MB" %
+          (seconds, output / 1024.0 / 1024, peak / 1024.0 / 1024))
+
+
+@benchmark
+def catalogs():
+    """Lookup time and private memory of a 20000 message catalog with and without mapping.
+
+    The catalog is looked up through 'gettext.GNUTranslations' (loaded into
+    memory by each process) and through 'lcg.MappedTranslations' (shared by
+    all processes mapping the same file).  The lookup time includes repeated
+    lookups of the same messages.  'lcg.MappedTranslations' keeps the messages
+    found in private memory, so its private memory is also reported after
+    using a fresh instance for a part of the messages.
+
+    """
+    import gettext
+    import shutil
+    import tempfile
+
+    class Translations(gettext.GNUTranslations):
+        def __init__(self, catalog):
+            gettext.NullTranslations.__init__(self)
+            self._catalog = catalog
+            self._info = {}
+
+    def copy(string):
+        # Return a new instance equal to 'string' (as when read from a file).
+        return string.encode('utf-8').decode('utf-8')
+    messages = ['Message number %d with some text' % i for i in range(20000)]
+    catalog = dict((m, m.upper()) for m in messages)
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'catalog')
+        lcg.MappedTranslations.compile(Translations(catalog), filename)
+        for name, load in (('gettext', lambda: Translations(dict((copy(k), copy(v)) for k, v
+                                                                 in catalog.items()))),
+                           ('mapped', lambda: lcg.MappedTranslations(filename))):
+            tracemalloc.start()
+            translations = load()
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result, seconds = timed(lambda: [translations.gettext(m) for m in messages * 10])
+            translations = load()
+            tracemalloc.start()
+            for m in messages[:len(messages) // 10]:
+                translations.gettext(m)
+            used, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("%-8s %6.2f us per lookup, %7.1f kB private memory "
+                  "(+%.1f kB after using 10%% of messages)" %
+                  (name, seconds * 1000000 / len(result), size / 1024.0, used / 1024.0))
+    finally:
+        shutil.rmtree(directory)
+
+
+@benchmark
+def sections():
+    """Allocations and time of section ids and headings in a 10k section document.
+
+    Each section's 'id()' and 'heading()' are requested in three passes (as in
+    typical export of the section, its table of contents entry and a link to
+    it).  The repeated passes should not create new content elements and their
+    peak memory should be negligible.
+
+    """
+    text = '= Document =\n\n' + ''.join(
+        '== Section %d ==\n\nText.\n\n=== Subsection %d ===\n\nText.\n\n' % (i, i)
+        for i in range(5000)
+    )
+    content = lcg.Container(lcg.Parser().parse(text))
+    created = [0]
+    content_init = lcg.Content.__init__
+
+    def counting_init(self, *args, **kwargs):
+        created[0] += 1
+        content_init(self, *args, **kwargs)
+
+    def walk(container):
+        for section in container.sections():
+            section.id()
+            section.heading()
+            walk(section)
+    lcg.Content.__init__ = counting_init
+    try:
+        for i in range(3):
+            created[0] = 0
+            tracemalloc.start()
+            result, seconds = timed(walk, content)
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("pass %d: %7.3f s, %6d content elements created, peak %7.1f kB" %
+                  (i + 1, seconds, created[0], peak / 1024.0))
+    finally:
+        lcg.Content.__init__ = content_init
+
+
+@benchmark
+def memory():
+    """Memory used by content of the 'doc/src' document tree read 100 times.
+
+    All the trees are kept alive, so the reported memory includes the content
+    elements, the nodes and everything they refer to.
+
+    """
+    import gc
+    src = os.path.join(os.path.dirname(__file__), '..', 'doc', 'src')
+    tracemalloc.start()
+    trees = [lcg.reader(src, 'index').build() for i in range(100)]
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    elements = len([x for x in gc.get_objects() if isinstance(x, lcg.Content)])
+    print("%d trees, %d content elements: %7.1f MB (%d bytes per element)" %
+          (len(trees), elements, size / 1024.0 / 1024, size / elements))
+
+
+def main(names):
+    benchmarks = dict((f.__name__, f) for f in BENCHMARKS)
+    for name in names or [f.__name__ for f in BENCHMARKS]:
+        try:
+            function = benchmarks[name]
+        except KeyError:
+            raise SystemExit("Unknown benchmark: %s (use one of: %s)" %
+                             (name, ', '.join(sorted(benchmarks))))
+        print("%s: %s" % (name, function.__doc__.splitlines()[0]))
+        function()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])